@@ -0,0 +1,53 @@
+import warnings
+import pandas as pd
+import pytest
+import wa_data_handler as dh
+import wa_dataset as ds
+import wa_processing as proc
+import wa_synthetic as syn
+
+ATTACK_COUNT = 2000
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    war_data = syn.war_report(ATTACK_COUNT)["rankedwarreport"]
+    attack_df = dh.load_dict_flatten_into_df(syn.attacks(ATTACK_COUNT), "attacks")
+    revive_df = dh.load_dict_flatten_into_df(
+        syn.revives(ATTACK_COUNT // 4, ATTACK_COUNT), "revives"
+    )
+    return ds.WarDataset(
+        dh.prepare_attack_dataframe(attack_df, war_data, label=None),
+        dh.prepare_revive_dataframe(revive_df, label=None),
+        war_data,
+        proc.extract_faction_info(syn.faction_basic()),
+        syn.WAR_ID,
+    )
+
+
+def frame_hash(df):
+    return int(pd.util.hash_pandas_object(df.astype("string"), index=True).sum())
+
+
+def test_charts_leave_the_shared_frames_unchanged(dataset):
+    """The assists chart used to write "Other" into the Attacker Faction of the shared attacks"""
+    attacks = frame_hash(dataset.attacks)
+    revives = frame_hash(dataset.revives)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        dh.create_dataset_summary_table(dataset)
+        figs = list(dh.iter_war_figures(dataset))
+    assert len(figs) == 8
+    assert frame_hash(dataset.attacks) == attacks
+    assert frame_hash(dataset.revives) == revives
+    assert not dataset.attacks["Attacker Faction"].eq("Other").any()
+
+
+def test_views_are_cached_and_owned(dataset):
+    assert dataset.war_hits is dataset.war_hits
+    assert dataset.war_hits["Attacker Faction"].isin(dataset.faction_names).all()
+    assert dataset.our_revives["Target Faction"].eq(dataset.our_faction).all()
+    view = dataset.our_attacks
+    view["Attacker"] = "changed"
+    assert not dataset.attacks["Attacker"].eq("changed").any()
+    del dataset.__dict__["our_attacks"]  # Cached view changed by this test
@@ -0,0 +1,57 @@
+import wa_ratelimit as rl
+
+
+class FakeClock:
+    """Replaces the limiter's monotonic and sleep, so minutes of calls run instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_calls(monkeypatch, calls, penalize_at=()):
+    clock = FakeClock()
+    monkeypatch.setattr(rl, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rl, "sleep", clock.sleep)
+    limiter = rl.RateLimiter()
+    times = []
+    for number in range(calls):
+        limiter.acquire()
+        times.append(clock.now)
+        if number in penalize_at:
+            limiter.penalize()
+        clock.now += 0.05  # Response time
+    return limiter, times
+
+
+def max_calls_in_window(times):
+    """Most calls made in any WINDOW_SECONDS long window"""
+    most = 0
+    start = 0
+    for end, time in enumerate(times):
+        while time - times[start] >= rl.WINDOW_SECONDS:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+
+def test_no_window_exceeds_budget(monkeypatch):
+    limiter, times = make_calls(monkeypatch, 300)
+    assert max_calls_in_window(times) == rl.API_CALLS_PER_MINUTE
+    assert limiter.calls == 300
+
+
+def test_budget_is_used_without_waiting(monkeypatch):
+    _, times = make_calls(monkeypatch, rl.API_CALLS_PER_MINUTE)
+    assert times[-1] - times[0] < 5
+
+
+def test_penalize_stops_calls_for_the_backoff(monkeypatch):
+    _, times = make_calls(monkeypatch, 3, penalize_at={0})
+    assert times[1] - times[0] >= 5
+    assert max_calls_in_window(times) <= rl.API_CALLS_PER_MINUTE
@@ -0,0 +1,404 @@
+from functools import cached_property
+import pandas as pd
+
+# Results that count as a successful hit
+HIT_RESULTS = ["Attacked", "Hospitalized", "Mugged", "Arrested"]
+FAILED_RESULTS = ["Interrupted", "Lost", "Escape", "Stalemate", "Timeout"]
+# Chain counts that award bonus respect, these hits are left out of player scores
+CHAIN_BONUS_HITS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000]
+RETALIATION_MODIFIER = 1.50
+
+
+def as_strings(df, columns):
+    """Turns categorical key columns of an aggregate back into strings, so aggregates merge cleanly"""
+    for column in columns:
+        df[column] = df[column].astype("string")
+    return df
+
+
+def count_by(df, columns, name):
+    """Counts rows for each combination of columns that occurs, like value_counts.
+    Categorical frames would otherwise count every combination of categories.
+
+    Returns dataframe with the key columns and a count column called name
+    """
+    counts = (
+        df.groupby(columns, observed=True)
+        .size()
+        .reset_index(name=name)
+        .sort_values(by=name, ascending=False)
+    )
+    return as_strings(counts, columns)
+
+
+def combine_counts(old, new, columns, name, by_count=True):
+    """Adds up two aggregates keyed by columns, ex: player totals from earlier and new attacks.
+    Returns dataframe sorted by name like count_by, or by the key columns like a groupby if by_count is False"""
+    combined = (
+        pd.concat([old, new], ignore_index=True)
+        .groupby(columns, sort=not by_count)[name]
+        .sum()
+        .reset_index()
+    )
+    if by_count:
+        combined = combined.sort_values(by=name, ascending=False, kind="stable")
+    return as_strings(combined, columns)
+
+
+def extend_cumulative(old, new, group_column, name):
+    """Appends a cumulative_by series of new events to the series of earlier events.
+    The running counts of new continue from the last count of each group in old."""
+    offsets = old.groupby(group_column, observed=True)[name].max() + 1
+    offsets.index = offsets.index.astype("string")
+    new = new.copy()
+    new[name] = new[name] + new[group_column].astype("string").map(offsets).fillna(
+        0
+    ).astype(new[name].dtype)
+    return pd.concat([old, new])
+
+
+def cumulative_by(df, group_column, name):
+    """Returns a new dataframe with the Time and group_column of df, plus a running count per group called name"""
+    return pd.DataFrame(
+        {
+            "Time": df["Time"],
+            group_column: df[group_column],
+            name: df.groupby(group_column, observed=True).cumcount(),
+        }
+    )
+
+
+class WarAggregates:
+    """Masks, counts and sums shared by the summary table and the graphs.
+    Attack frames need the columns added by wa_data_handler.enrich_attack_dataframe.
+    Each part is computed the first time it is used, then reused by every other chart.
+    Only the arguments needed by the parts that are used have to be given.
+    """
+
+    def __init__(
+        self, attack_df=None, revive_df=None, war_data=None, basic_faction_info=None
+    ):
+        self.attack_df = attack_df
+        self.revive_df = revive_df
+        self.war_data = war_data
+        self.basic_faction_info = basic_faction_info
+
+    @cached_property
+    def factions(self):
+        """(faction1_id, faction2_id, faction1, faction2) from the war report"""
+        factions = list(self.war_data["factions"].keys())
+        return (
+            factions[0],
+            factions[1],
+            self.war_data["factions"][factions[0]]["name"],
+            self.war_data["factions"][factions[1]]["name"],
+        )
+
+    @property
+    def faction_names(self):
+        return [self.factions[2], self.factions[3]]
+
+    @property
+    def our_faction(self):
+        return self.basic_faction_info["name"]
+
+    # Attack masks
+
+    @cached_property
+    def attacker_in_war(self):
+        """Attacks made by either warring faction"""
+        return self.attack_df["Attacker Faction"].isin(self.faction_names)
+
+    @property
+    def war_hits(self):
+        """Attacks made by one warring faction on the other"""
+        return self.attack_df["is_war_hit"]
+
+    @cached_property
+    def scoring_hits(self):
+        """Ranked war hits that gained respect, without chain bonus hits"""
+        df = self.attack_df
+        return (df["ranked_war"] > 0) & (df["respect_gain"] > 0) & ~df["is_chain_bonus"]
+
+    # Faction totals
+
+    @cached_property
+    def faction_counts(self):
+        """Attack counts for each warring faction, computed with one groupby.
+        Columns: War Hits, Non-War Hits, Assists, Retaliations, Failed Attacks, Total Attacks
+        """
+        df = self.attack_df
+        flags = pd.DataFrame(
+            {
+                "War Hits": df["ranked_war"].eq(1),
+                "Non-War Hits": df["ranked_war"].eq(0) & df["outcome"].eq("hit"),
+                "Assists": df["is_assist"],
+                "Retaliations": df["is_retaliation"],
+                "Failed Attacks": df["is_failed"],
+                "Total Attacks": True,
+            },
+            index=df.index,
+        )
+        in_war = self.attacker_in_war
+        counts = flags.loc[in_war].groupby(
+            df["Attacker Faction"].loc[in_war].astype("string")
+        ).sum()
+        counts = counts.reindex(self.faction_names, fill_value=0)
+        counts.index.name = "Faction"
+        return counts
+
+    @cached_property
+    def respect_sums(self):
+        """Respect gained and lost in the attacks of each warring faction, indexed by faction.
+        Columns: respect_gain, respect_loss"""
+        df = self.attack_df
+        gain = df.groupby("Attacker Faction", observed=True)["respect_gain"].sum()
+        loss = df.groupby("Defender Faction", observed=True)["respect_loss"].sum()
+        gain.index = gain.index.astype("string")
+        loss.index = loss.index.astype("string")
+
+        return pd.DataFrame(
+            {
+                "respect_gain": gain.reindex(self.faction_names, fill_value=0),
+                "respect_loss": loss.reindex(self.faction_names, fill_value=0),
+            }
+        )
+
+    def bonus_respect(self, faction_id):
+        """Respect rewarded to a faction at the end of the war, 0 while the war is running"""
+        rewards = self.war_data["factions"][faction_id].get("rewards", {})
+        return rewards.get("respect", 0)
+
+    @cached_property
+    def faction_respect(self):
+        """Respect gained and lost by each warring faction, gain includes the bonus respect from the war report.
+        Columns: Faction, respect_gain, respect_loss
+        """
+        respect = self.respect_sums.copy()
+        faction1_id, faction2_id, faction1, faction2 = self.factions
+        respect.at[faction1, "respect_gain"] += self.bonus_respect(faction1_id)
+        respect.at[faction2, "respect_gain"] += self.bonus_respect(faction2_id)
+        respect.index.name = "Faction"
+        return respect.sort_index().reset_index()
+
+    # Series over time
+
+    @cached_property
+    def war_attacks_over_time(self):
+        """Time, Attacker Faction and Cumulative Faction Attacks of every war hit"""
+        return cumulative_by(
+            self.attack_df.loc[self.war_hits],
+            "Attacker Faction",
+            "Cumulative Faction Attacks",
+        )
+
+    @cached_property
+    def assists_over_time(self):
+        """Time, Attacker Faction and Cumulative Faction Assists of assists by the warring factions"""
+        df = self.attack_df
+        return cumulative_by(
+            df.loc[df["is_assist"] & self.attacker_in_war],
+            "Attacker Faction",
+            "Cumulative Faction Assists",
+        )
+
+    # Player totals
+
+    @cached_property
+    def player_score_gained(self):
+        """Player, Faction and Score Gained from scoring hits"""
+        score = (
+            self.attack_df.loc[self.scoring_hits]
+            .groupby(["Attacker", "Attacker Faction"], observed=True)["respect_gain"]
+            .sum()
+            .reset_index()
+        )
+        score = as_strings(score, ["Attacker", "Attacker Faction"])
+        return score.rename(
+            columns={
+                "Attacker": "Player",
+                "Attacker Faction": "Faction",
+                "respect_gain": "Score Gained",
+            }
+        )
+
+    @cached_property
+    def player_score_ceded(self):
+        """Player, Faction and Score Ceded to scoring hits"""
+        score = (
+            self.attack_df.loc[self.scoring_hits]
+            .groupby(["Defender", "Defender Faction"], observed=True)["respect_gain"]
+            .sum()
+            .reset_index()
+        )
+        score = as_strings(score, ["Defender", "Defender Faction"])
+        return score.rename(
+            columns={
+                "Defender": "Player",
+                "Defender Faction": "Faction",
+                "respect_gain": "Score Ceded",
+            }
+        )
+
+    @cached_property
+    def player_attacks_made(self):
+        """Player, Faction and number of attacks Made"""
+        return count_by(
+            self.attack_df, ["Attacker", "Attacker Faction"], "Made"
+        ).rename(columns={"Attacker": "Player", "Attacker Faction": "Faction"})
+
+    @cached_property
+    def player_attacks_received(self):
+        """Player, Faction and number of attacks Received"""
+        return count_by(
+            self.attack_df, ["Defender", "Defender Faction"], "Received"
+        ).rename(columns={"Defender": "Player", "Defender Faction": "Faction"})
+
+    # Revives
+
+    @cached_property
+    def our_revives(self):
+        """Revives received by our faction"""
+        return self.revive_df.loc[
+            self.revive_df["Target Faction"].eq(self.our_faction)
+        ]
+
+    @cached_property
+    def revives_over_time(self):
+        """Time, Target Faction and Cumulative Revives of revives received by our faction"""
+        return cumulative_by(self.our_revives, "Target Faction", "Cumulative Revives")
+
+    @cached_property
+    def player_revives_over_time(self):
+        """Time, Target and Cumulative Revives for each player of our faction"""
+        return cumulative_by(self.our_revives, "Target", "Cumulative Revives")
+
+    @cached_property
+    def player_revive_results(self):
+        """Target, result and count of revives received by players of our faction"""
+        return count_by(self.our_revives, ["Target", "result"], "count")
+
+    @cached_property
+    def revive_result_counts(self):
+        """Number of revives received by our faction for each result, ex: "success" """
+        return self.our_revives["result"].astype("string").value_counts()
+
+    # Incremental updates
+
+    def extend(self, attack_df=None, revive_df=None):
+        """Updates the aggregates for rows appended to the frames, ex: new events of a running war.
+        attack_df and revive_df are the whole frames, with the earlier rows first and unchanged.
+        Parts already computed are combined with the same parts of only the new rows, sums and counts are added
+        and running counts continue. Parts that can't be combined are computed again the next time they are used.
+        """
+        new_attacks = None
+        new_revives = None
+        if attack_df is not None and self.attack_df is not None:
+            new_attacks = attack_df.iloc[self.attack_df.shape[0] :]
+        if revive_df is not None and self.revive_df is not None:
+            new_revives = revive_df.iloc[self.revive_df.shape[0] :]
+        if attack_df is not None:
+            self.attack_df = attack_df
+        if revive_df is not None:
+            self.revive_df = revive_df
+
+        cached = [part for part in self.__dict__ if part in _EXTEND_RULES]
+        for part in list(self.__dict__):
+            if part not in _EXTEND_RULES and part not in _FRAMES:
+                del self.__dict__[part] # Computed again when it is next used
+        self.add_rows(new_attacks, new_revives, cached)
+
+    def add_rows(self, new_attacks=None, new_revives=None, parts=None):
+        """Adds prepared new rows to parts of the aggregates without needing the earlier rows,
+        ex: the pages of a download as they arrive. Parts not computed yet start from the new rows.
+        The frames aren't changed, set attack_df and revive_df to the whole frames once every row was added.
+
+        parts -- names of the parts to update, default STREAMED_PARTS
+        """
+        if parts is None:
+            parts = STREAMED_PARTS
+        new = WarAggregates(
+            new_attacks, new_revives, self.war_data, self.basic_faction_info
+        )
+        for part in parts:
+            frame, combine = _EXTEND_RULES[part]
+            new_frame = new_attacks if frame == "attack_df" else new_revives
+            if new_frame is None or new_frame.shape[0] == 0:
+                continue
+            if part in self.__dict__:
+                self.__dict__[part] = combine(self.__dict__[part], getattr(new, part))
+            else:
+                self.__dict__[part] = getattr(new, part)
+
+
+# Totals that don't depend on the order of the rows, updated by add_rows while a war downloads
+STREAMED_PARTS = [
+    "faction_counts",
+    "respect_sums",
+    "player_score_gained",
+    "player_score_ceded",
+    "player_attacks_made",
+    "player_attacks_received",
+    "player_revive_results",
+    "revive_result_counts",
+]
+# Attributes holding the inputs, kept by extend
+_FRAMES = {"attack_df", "revive_df", "war_data", "basic_faction_info", "factions"}
+# Cached part -> (frame it is computed from, function combining the part for earlier rows with the part for new rows)
+_EXTEND_RULES = {
+    "attacker_in_war": ("attack_df", lambda old, new: pd.concat([old, new])),
+    "scoring_hits": ("attack_df", lambda old, new: pd.concat([old, new])),
+    "faction_counts": ("attack_df", lambda old, new: old + new),
+    "respect_sums": ("attack_df", lambda old, new: old + new),
+    "war_attacks_over_time": (
+        "attack_df",
+        lambda old, new: extend_cumulative(
+            old, new, "Attacker Faction", "Cumulative Faction Attacks"
+        ),
+    ),
+    "assists_over_time": (
+        "attack_df",
+        lambda old, new: extend_cumulative(
+            old, new, "Attacker Faction", "Cumulative Faction Assists"
+        ),
+    ),
+    "player_score_gained": (
+        "attack_df",
+        lambda old, new: combine_counts(
+            old, new, ["Player", "Faction"], "Score Gained", by_count=False
+        ),
+    ),
+    "player_score_ceded": (
+        "attack_df",
+        lambda old, new: combine_counts(
+            old, new, ["Player", "Faction"], "Score Ceded", by_count=False
+        ),
+    ),
+    "player_attacks_made": (
+        "attack_df",
+        lambda old, new: combine_counts(old, new, ["Player", "Faction"], "Made"),
+    ),
+    "player_attacks_received": (
+        "attack_df",
+        lambda old, new: combine_counts(old, new, ["Player", "Faction"], "Received"),
+    ),
+    "our_revives": ("revive_df", lambda old, new: pd.concat([old, new])),
+    "revives_over_time": (
+        "revive_df",
+        lambda old, new: extend_cumulative(
+            old, new, "Target Faction", "Cumulative Revives"
+        ),
+    ),
+    "player_revives_over_time": (
+        "revive_df",
+        lambda old, new: extend_cumulative(old, new, "Target", "Cumulative Revives"),
+    ),
+    "player_revive_results": (
+        "revive_df",
+        lambda old, new: combine_counts(old, new, ["Target", "result"], "count"),
+    ),
+    "revive_result_counts": (
+        "revive_df",
+        lambda old, new: old.add(new, fill_value=0).astype("int64"),
+    ),
+}
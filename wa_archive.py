@@ -0,0 +1,185 @@
+from contextlib import closing
+import os
+import sqlite3
+
+ARCHIVE_FILE = "wa_archive.sqlite"
+# Column each log is ordered and queried by
+TIMESTAMP_COLUMNS = {"attacks": "timestamp_started", "revives": "timestamp"}
+
+
+def connect(path=ARCHIVE_FILE):
+    """Opens the archive of every attack and revive downloaded so far, creating it on first use.
+    Each log has a table of flattened rows keyed by (scope, key), the scope is the faction the log belongs to.
+    The coverage table holds the time ranges of each log that were downloaded completely.
+    Use one connection per thread."""
+    conn = sqlite3.connect(path, timeout=60)
+    # Lets batch downloads write from several threads while worker processes read
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS coverage "
+        + "(kind TEXT, scope TEXT, start INTEGER, end INTEGER)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS coverage_scope ON coverage (kind, scope, start)")
+    return conn
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _table_columns(conn, kind):
+    return [row[1] for row in conn.execute("PRAGMA table_info(" + kind + ")")]
+
+
+def _ensure_table(conn, kind, columns):
+    """Creates the table of a log, or adds columns the API didn't send before.
+    Batch downloads can get here from several threads at once."""
+    existing = _table_columns(conn, kind)
+    if not existing:
+        # Columns without a type keep the values as they are stored, like the flattened arrays
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS " + kind + " (scope TEXT, key TEXT, "
+            + ", ".join(_quote(column) for column in columns)
+            + ", PRIMARY KEY (scope, key))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS " + kind + "_time ON " + kind
+            + " (scope, " + _quote(TIMESTAMP_COLUMNS[kind]) + ")"
+        )
+        existing = _table_columns(conn, kind)
+    for column in columns:
+        if column not in existing:
+            try:
+                conn.execute("ALTER TABLE " + kind + " ADD COLUMN " + _quote(column))
+            except sqlite3.OperationalError:
+                if column not in _table_columns(conn, kind):
+                    raise
+                # Added by another download meanwhile
+
+
+def store_rows(conn, kind, scope, rows):
+    """Flattens and stores rows of a log, ex: one page of attacks. Rows already stored are replaced."""
+    import wa_data_handler as dh
+
+    if not rows:
+        return
+    columns = dh.flatten_rows(list(rows.values()), dh.TEXT_FIELDS[kind])
+    _ensure_table(conn, kind, list(columns))
+    names = ["scope", "key"] + list(columns)
+    # NaN is stored as NULL
+    values = zip(
+        [scope] * len(rows),
+        list(rows.keys()),
+        *(values.tolist() for values in columns.values()),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO " + kind + " ("
+        + ", ".join(_quote(name) for name in names)
+        + ") VALUES (" + ", ".join("?" * len(names)) + ")",
+        values,
+    )
+
+
+def covered_ranges(conn, kind, scope):
+    """Returns the downloaded time ranges of a log as sorted, merged [start, end] pairs"""
+    ranges = []
+    for start, end in conn.execute(
+        "SELECT start, end FROM coverage WHERE kind = ? AND scope = ? ORDER BY start",
+        (kind, scope),
+    ):
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def add_coverage(conn, kind, scope, start, end):
+    """Records that every event of a log from start to end, inclusive, is stored.
+    Ranges are only added, covered_ranges merges them, so downloads in other threads never overwrite each other's."""
+    if end < start:
+        return
+    conn.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (kind, scope, start, end))
+
+
+def stored_keys(conn, kind, scope, start, end):
+    """Returns the set of keys of the stored events of a log from start to end"""
+    if not _table_columns(conn, kind):
+        return set()
+    return {
+        row[0]
+        for row in conn.execute(
+            "SELECT key FROM " + kind + " WHERE scope = ? AND "
+            + _quote(TIMESTAMP_COLUMNS[kind]) + " BETWEEN ? AND ?",
+            (scope, start, end),
+        )
+    }
+
+
+def find_gaps(conn, kind, scope, start, end):
+    """Returns the (start, end) time ranges from start to end that aren't covered yet, oldest first"""
+    gaps = []
+    cursor = start
+    for range_start, range_end in covered_ranges(conn, kind, scope):
+        if range_end < cursor:
+            continue
+        if range_start > end:
+            break
+        if range_start > cursor:
+            gaps.append((cursor, range_start - 1))
+        cursor = range_end + 1
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def count_rows(conn, kind, scope, start, end):
+    """Number of stored events of a log from start to end"""
+    if not _table_columns(conn, kind):
+        return 0
+    return conn.execute(
+        "SELECT COUNT(*) FROM " + kind + " WHERE scope = ? AND "
+        + _quote(TIMESTAMP_COLUMNS[kind]) + " BETWEEN ? AND ?",
+        (scope, start, end),
+    ).fetchone()[0]
+
+
+def _range_query(conn, kind):
+    """Query for the flattened rows of one scope and time range, in time order"""
+    columns = [column for column in _table_columns(conn, kind) if column not in ("scope", "key")]
+    timestamp = _quote(TIMESTAMP_COLUMNS[kind])
+    return (
+        "SELECT " + ", ".join(_quote(column) for column in columns)
+        + " FROM " + kind + " WHERE scope = ? AND " + timestamp + " BETWEEN ? AND ?"
+        + " ORDER BY " + timestamp + ", key"
+    )
+
+
+def iter_frames(kind, scope, start, end, chunk_rows, path=ARCHIVE_FILE):
+    """Yields the stored events of a log from start to end as flattened dataframes of up to chunk_rows rows,
+    with the columns load_dict_flatten_into_df makes from downloaded rows. None yields a single dataframe."""
+    import pandas as pd
+
+    if not os.path.exists(path):
+        return
+    with closing(connect(path)) as conn:
+        if not _table_columns(conn, kind):
+            return
+        frames = pd.read_sql_query(
+            _range_query(conn, kind), conn, params=(scope, start, end), chunksize=chunk_rows
+        )
+        if chunk_rows is None:
+            frames = [frames]
+        for df in frames:
+            if len(df):
+                yield df
+
+
+def load_frame(kind, scope, start, end, path=ARCHIVE_FILE):
+    """Returns the stored events of a log from start to end as one flattened dataframe,
+    the range query that replaces load_dict_flatten_into_df for downloaded wars"""
+    import wa_data_handler as dh
+
+    for df in iter_frames(kind, scope, start, end, None, path):
+        return df
+    return dh.empty_log_dataframe(kind)
@@ -0,0 +1,129 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import multiprocessing
+import os
+import wa_pipeline as pipe
+import wa_requests as req
+
+# Wars downloading at the same time. They share the keys' rate limiters, so more threads only
+# overlap the wait for responses, they don't make more requests per minute. More keys do
+DOWNLOAD_THREADS = 3
+# Processes preparing wars and writing reports, None uses one per cpu core
+PROCESS_WORKERS = None
+
+
+def _process_war(war_id, war_data, basic_faction_info, display_mode, saved):
+    """Runs in a worker process. Loads one war, from its saved files or the archive its download went to,
+    prepares it and writes the report. Returns war_id"""
+    if saved:
+        attack_df, revive_df = pipe.import_war(war_id, war_data)
+    else:
+        attack_df, revive_df = pipe.load_archived_war(
+            war_data, basic_faction_info["ID"], war_id
+        )
+    # One image process per war, the wars themselves are already spread over the cores
+    pipe.write_war_report(
+        attack_df,
+        revive_df,
+        war_data,
+        basic_faction_info,
+        war_id,
+        display_mode,
+        image_workers=1,
+    )
+    return war_id
+
+
+def _download_war(api_key, war_id, war_data, scope):
+    """Downloads a war into the archive. The rows are dropped here and read back by the worker
+    process, so they aren't copied between processes. Quiet, the progress lines of wars
+    downloading at the same time would overwrite each other"""
+    pipe.download_war(api_key, war_data["war"], scope, quiet=True)
+    return war_id
+
+
+def run_batch(api_key, basic_faction_info, war_ids, display_mode):
+    """Downloads, prepares and reports every war in war_ids without further prompts.
+    Downloads run in threads under the keys' shared rate limits. Each war is handed to a pool
+    of worker processes as soon as its download completes, while the next wars keep downloading.
+    Wars that fail are reported and skipped.
+
+    Returns list of war IDs that finished
+    """
+    wars = dict()
+    for war_id in war_ids:
+        war_data = req.requestData(api_key, 2, war_id)["rankedwarreport"]
+        if not req.war_has_ended(war_data["war"]):
+            print("War " + str(war_id) + " has not ended, skipping..")
+            continue
+        wars[war_id] = war_data
+    print("\nBatch mode: " + str(len(wars)) + " wars..")
+
+    workers = PROCESS_WORKERS or os.cpu_count() or 1
+    finished = []
+    failed = []
+    # Download, limiter and session threads are running, a forked worker could copy a lock one of them holds
+    spawn = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as downloads, ProcessPoolExecutor(
+        max_workers=workers, mp_context=spawn
+    ) as processing:
+        # future -> (war_id, "download" or "report")
+        pending = dict()
+        for war_id, war_data in wars.items():
+            if pipe.war_files_saved(war_id):
+                print("War " + str(war_id) + " was saved before, importing..")
+                future = processing.submit(
+                    _process_war,
+                    war_id,
+                    war_data,
+                    basic_faction_info,
+                    display_mode,
+                    True,
+                )
+                pending[future] = (war_id, "report")
+            else:
+                future = downloads.submit(
+                    _download_war, api_key, war_id, war_data, basic_faction_info["ID"]
+                )
+                pending[future] = (war_id, "download")
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                war_id, stage = pending.pop(future)
+                try:
+                    future.result()
+                except (Exception, SystemExit) as error:
+                    print("\nWar " + str(war_id) + " " + stage + " failed: " + repr(error))
+                    failed.append(war_id)
+                    continue
+
+                if stage == "download":
+                    print("War " + str(war_id) + " downloaded..")
+                    report = processing.submit(
+                        _process_war,
+                        war_id,
+                        wars[war_id],
+                        basic_faction_info,
+                        display_mode,
+                        False,
+                    )
+                    pending[report] = (war_id, "report")
+                else:
+                    print("War " + str(war_id) + " finished.")
+                    finished.append(war_id)
+
+    print(
+        "\nBatch finished: "
+        + str(len(finished))
+        + " of "
+        + str(len(wars))
+        + " wars analyzed."
+    )
+    if failed:
+        print("Failed wars: " + ", ".join(str(war_id) for war_id in failed))
+    return finished
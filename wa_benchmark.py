@@ -0,0 +1,194 @@
+import argparse
+from contextlib import redirect_stdout
+import io as text_io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from time import strftime
+import numpy as np
+import pandas as pd
+import plotly
+from tabulate import tabulate
+import wa_data_handler as dh
+import wa_dataset as ds
+import wa_io as io
+import wa_processing as proc
+import wa_profile as prof
+import wa_synthetic as syn
+
+DEFAULT_SIZES = ["10k", "100k"]
+BENCHMARK_FOLDER = "benchmarks"
+# Revives generated per attack, about what a real war has
+REVIVES_PER_ATTACK = 0.25
+
+
+def parse_size(size):
+    """Number of attacks from "10k", "1m" or "5000" """
+    size = size.lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(size[-1], 1)
+    if multiplier != 1:
+        size = size[:-1]
+    return int(float(size) * multiplier)
+
+
+def run_stages(profile, attack_count, seed=0):
+    """Runs every stage of an analysis of a synthetic war, from the raw API dicts to the html report,
+    recording them in a wa_profile.RunProfile. Returns the profile's stage records"""
+    attack_data = syn.attacks(attack_count, seed)
+    revive_data = syn.revives(int(attack_count * REVIVES_PER_ATTACK), attack_count, seed)
+    war_data = syn.war_report(attack_count)["rankedwarreport"]
+    basic_faction_info = proc.extract_faction_info(syn.faction_basic())
+
+    # Progress messages would bury the results
+    with redirect_stdout(text_io.StringIO()):
+        with profile.stage("load attacks"):
+            attack_df = dh.load_dict_flatten_into_df(attack_data, "attacks")
+        with profile.stage("load revives"):
+            revive_df = dh.load_dict_flatten_into_df(revive_data, "revives")
+        del attack_data, revive_data
+        with profile.stage("prepare attacks"):
+            attack_df = dh.prepare_attack_dataframe(attack_df, war_data)
+        with profile.stage("prepare revives"):
+            revive_df = dh.prepare_revive_dataframe(revive_df)
+
+        dataset = ds.WarDataset(attack_df, revive_df, war_data, basic_faction_info)
+        with profile.stage("summary table"):
+            summary_table = dh.create_dataset_summary_table(dataset)
+
+        figs = list(
+            profile.iter_stage(
+                dh.iter_war_figures(dataset),
+                lambda fig: "chart: " + fig.layout.title.text,
+                rows=None,
+            )
+        )
+
+        with tempfile.TemporaryDirectory() as folder:
+            cwd = os.getcwd()
+            os.chdir(folder)
+            try:
+                with profile.stage("display_figs html"):
+                    io.display_figs(figs, 0, war_data, 0, summary_table)
+            finally:
+                os.chdir(cwd)
+    return profile.to_dict()["stages"]
+
+
+def benchmark(attack_count, memory=True, seed=0):
+    """Times every stage for a war of attack_count attacks, then traces their peak memory unless memory is False.
+    Memory is traced in its own run, tracing slows the code down too much to time it at the same time.
+    Returns dict of stage -> {"seconds", "peak_mb"}"""
+    stages = run_stages(prof.RunProfile(trace_memory=False), attack_count, seed)
+    peaks = dict()
+    if memory:
+        profile = prof.RunProfile(trace_memory=True)
+        try:
+            peaks = {
+                record["stage"]: record["peak_mb"]
+                for record in run_stages(profile, attack_count, seed)
+            }
+        finally:
+            profile.close()
+    return {
+        record["stage"]: {"seconds": record["seconds"], "peak_mb": peaks.get(record["stage"])}
+        for record in stages
+    }
+
+
+def version_info():
+    """Code version and the versions of the libraries that matter for speed"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or "unknown",
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plotly": plotly.__version__,
+    }
+
+
+def save_results(results, folder=BENCHMARK_FOLDER):
+    """Saves results as benchmarks/benchmark-<commit>-<time>.json, returns the filename"""
+    os.makedirs(folder, exist_ok=True)
+    filename = os.path.join(
+        folder,
+        "benchmark-" + results["version"]["commit"] + "-" + strftime("%Y%m%d-%H%M%S") + ".json",
+    )
+    with open(filename, "w") as file:
+        json.dump(results, file, indent=2)
+    return filename
+
+
+def print_results(results, old_results=None):
+    """Prints a table per war size, with the old results and new / old ratios if given"""
+    for size, stages in results["sizes"].items():
+        old_stages = dict()
+        if old_results is not None:
+            old_stages = old_results["sizes"].get(size, dict())
+        rows = []
+        for stage, new in stages.items():
+            row = [stage, new["seconds"], new["peak_mb"]]
+            if old_results is not None:
+                old = old_stages.get(stage, dict())
+                row += [
+                    old.get("seconds"),
+                    _ratio(new["seconds"], old.get("seconds")),
+                    old.get("peak_mb"),
+                    _ratio(new["peak_mb"], old.get("peak_mb")),
+                ]
+            rows.append(row)
+        headers = ["Stage", "Seconds", "Peak MB"]
+        if old_results is not None:
+            headers += ["Old Seconds", "Ratio", "Old Peak MB", "Ratio"]
+        print("\n" + size + " attacks")
+        print(tabulate(rows, headers=headers, tablefmt="github"))
+
+
+def _ratio(new, old):
+    if not new or not old:
+        return None
+    return round(new / old, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time and memory profile every analysis stage on synthetic wars"
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", default=DEFAULT_SIZES, help="attacks per war, ex: 10k 100k 1m"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the slower memory tracing run"
+    )
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="don't save the results")
+    args = parser.parse_args()
+
+    results = {"version": version_info(), "sizes": dict()}
+    for size in args.sizes:
+        attack_count = parse_size(size)
+        print("Benchmarking a war of " + str(attack_count) + " attacks..")
+        results["sizes"][size] = benchmark(attack_count, not args.no_memory, args.seed)
+
+    old_results = None
+    if args.compare:
+        with open(args.compare) as file:
+            old_results = json.load(file)
+    print_results(results, old_results)
+    if not args.no_save:
+        print("\nSaved " + save_results(results) + ".")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+import tempfile
+from time import time
+
+CACHE_DIR = "wa_cache"
+# TTL for entries that never expire, ex: reports of finished wars
+NO_EXPIRY = None
+
+
+def make_cache_key(url, scope=None):
+    """Cache key for an API url without the key parameter.
+    scope separates results that depend on the key owner, like faction selections."""
+    if scope is None:
+        return url
+    return url + "#" + str(scope)
+
+
+def key_scope(api_key):
+    """One way fingerprint of an API key, so the key itself is never written to the cache"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _cache_file(cache_key):
+    return os.path.join(
+        CACHE_DIR, hashlib.sha1(cache_key.encode()).hexdigest() + ".json"
+    )
+
+
+def get(cache_key, ttl):
+    """Returns cached data if it is younger than ttl seconds, otherwise None"""
+    path = _cache_file(cache_key)
+    try:
+        with open(path) as file:
+            entry = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if entry["key"] != cache_key:
+        return None
+    if ttl is not NO_EXPIRY and time() - entry["stored"] > ttl:
+        return None
+    return entry["data"]
+
+
+def put(cache_key, data):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_file(cache_key)
+    # Write to a temporary file first so a crash never leaves a broken entry.
+    # Each writer gets its own, threads can store the same entry at once
+    handle, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as file:
+            json.dump({"key": cache_key, "stored": time(), "data": data}, file)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
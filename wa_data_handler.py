@@ -1,31 +1,197 @@
+import json
+from operator import itemgetter
 import pandas as pd
+from pandas.api.types import union_categoricals
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import wa_aggregates as agg
+import wa_downsample as down
 
-pd.options.mode.chained_assignment = None
 pd.options.plotting.backend = "plotly"
 
 
+# Row fields holding text, blank strings in them are loaded as missing values
+ATTACK_TEXT_FIELDS = {
+    "code",
+    "attacker_name",
+    "attacker_factionname",
+    "defender_name",
+    "defender_factionname",
+    "result",
+}
+REVIVE_TEXT_FIELDS = {
+    "reviver_name",
+    "reviver_factionname",
+    "target_name",
+    "target_factionname",
+    "target_hospital_reason",
+    "target_last_action.status",
+    "result",
+}
+TEXT_FIELDS = {"attacks": ATTACK_TEXT_FIELDS, "revives": REVIVE_TEXT_FIELDS}
+
+# Flattened columns of the downloaded rows and their types, for logs without any rows
+RAW_COLUMN_TYPES = {
+    "attacks": {
+        "code": "object",
+        "timestamp_started": "int64",
+        "timestamp_ended": "int64",
+        "attacker_id": "int64",
+        "attacker_name": "object",
+        "attacker_faction": "int64",
+        "attacker_factionname": "object",
+        "defender_id": "int64",
+        "defender_name": "object",
+        "defender_faction": "int64",
+        "defender_factionname": "object",
+        "result": "object",
+        "stealthed": "int64",
+        "respect": "float64",
+        "chain": "int64",
+        "raid": "int64",
+        "ranked_war": "int64",
+        "respect_gain": "float64",
+        "respect_loss": "float64",
+        "modifiers.fair_fight": "float64",
+        "modifiers.war": "int64",
+        "modifiers.retaliation": "float64",
+        "modifiers.group_attack": "int64",
+        "modifiers.overseas": "int64",
+        "modifiers.chain_bonus": "float64",
+    },
+    "revives": {
+        "timestamp": "int64",
+        "result": "object",
+        "chance": "float64",
+        "reviver_id": "int64",
+        "reviver_name": "object",
+        "reviver_faction": "int64",
+        "reviver_factionname": "object",
+        "target_id": "int64",
+        "target_name": "object",
+        "target_faction": "int64",
+        "target_factionname": "object",
+        "target_hospital_reason": "object",
+        "target_early_discharge": "int64",
+        "target_last_action.status": "object",
+        "target_last_action.timestamp": "int64",
+    },
+}
+
+# Columns with few distinct values, stored as categoricals in the prepared dataframes
+ATTACK_CATEGORY_COLUMNS = [
+    "Attacker",
+    "Defender",
+    "Attacker Faction",
+    "Defender Faction",
+    "result",
+]
+REVIVE_CATEGORY_COLUMNS = [
+    "Target",
+    "Reviver",
+    "Target Faction",
+    "Reviver Faction",
+    "target_hospital_reason",
+    "result",
+]
+# Outcome class of each attack result, results not listed are "other"
+OUTCOME_CLASSES = dict(
+    [(result, "hit") for result in agg.HIT_RESULTS]
+    + [(result, "failed") for result in agg.FAILED_RESULTS]
+    + [("Assist", "assist")]
+)
+# Float columns that are only multipliers or percentages, safe to store as float32
+# Respect columns stay float64 so the summed values don't pick up rounding noise
+COMPACT_FLOAT_PREFIXES = ("modifiers.", "chance")
+# Most points drawn by each cumulative chart, shared by its lines, see wa_downsample.
+# None draws every event
+LINE_POINT_BUDGET = 4000
+
+
+def _column(rows, key):
+    """Values of key in every row, None where a row doesn't have it"""
+    try:
+        return list(map(itemgetter(key), rows))
+    except KeyError:
+        return [row.get(key) for row in rows]
+
+
+def _union_keys(dicts, first):
+    """Keys of first, then the keys only some of dicts have in sorted order, so the columns come out the same every run.
+    Rows are normally uniform, only dicts whose keys differ from first's are searched for extra keys"""
+    keys = list(first)
+    first_keys = first.keys()
+    odd_dicts = [value for value in dicts if value.keys() != first_keys]
+    keys += sorted(set().union(*(value.keys() for value in odd_dicts)).difference(keys))
+    return keys
+
+
+def flatten_rows(rows, text_fields=()):
+    """Turns a list of row dicts into a dict of typed column arrays in one pass per column.
+    Nested objects become "parent.child" columns, ex: "modifiers.fair_fight".
+    Blank strings become None, only text fields are checked for whitespace.
+    """
+    columns = dict()
+    if len(rows) == 0:
+        return columns
+
+    for key in _union_keys(rows, rows[0]):
+        values = _column(rows, key)
+        sample = next((value for value in values if value is not None), None)
+        if isinstance(sample, dict):
+            parents = [value if isinstance(value, dict) else {} for value in values]
+            for child in _union_keys(parents, sample):
+                columns[key + "." + child] = _column(parents, child)
+        else:
+            columns[key] = values
+
+    for name, values in columns.items():
+        if name in text_fields:
+            blanks = {
+                value
+                for value in set(values)
+                if value.__class__ is str and not value.strip()
+            }
+            if blanks:
+                values = [None if value in blanks else value for value in values]
+            columns[name] = np.array(values, dtype=object)
+        else:
+            if "" in values:
+                values = [None if value == "" else value for value in values]
+            if None in values:
+                values = [np.NaN if value is None else value for value in values]
+            columns[name] = np.array(values)
+
+    return columns
+
+
 def load_dict_flatten_into_df(data, json_root):
     """Loads dict and flattens the elements
     json_root : the root that the archives are in, ex: "attacks" or "revives"
 
     Returns dataframe
     """
-    df = pd.DataFrame.from_dict(data)
+    rows = data[json_root]
+    if isinstance(rows, dict):
+        rows = list(rows.values())
+    if len(rows) == 0 and json_root in RAW_COLUMN_TYPES:
+        return empty_log_dataframe(json_root)
 
-    # list1 = []
-    # for x in df[json_root]:
-    #     list1.append(pd.DataFrame(pd.json_normalize(x)))
-    # flattened_df = pd.concat(list1, ignore_index=True)
+    return pd.DataFrame(flatten_rows(rows, TEXT_FIELDS.get(json_root, ())))
 
-    # Same thing as above, but using list comprehension for a one liner
-    flattened_df = pd.concat(
-        [pd.DataFrame(pd.json_normalize(x)) for x in df[json_root]], ignore_index=True
-    )
 
-    return flattened_df
+def empty_log_dataframe(json_root):
+    """Flattened dataframe without rows, with the columns and types of the rows of a log,
+    so the prepare functions work on a war without revives
+    json_root : "attacks" or "revives"
+    """
+    return pd.DataFrame(
+        {
+            column: pd.Series(dtype=dtype)
+            for column, dtype in RAW_COLUMN_TYPES[json_root].items()
+        }
+    )
 
 
 def load_json_flatten_into_df(filename, json_root):
@@ -34,17 +200,16 @@ def load_json_flatten_into_df(filename, json_root):
 
     Returns dataframe
     """
-    df = pd.read_json(filename)
-    flattened_df = pd.concat(
-        [pd.DataFrame(pd.json_normalize(x)) for x in df[json_root]], ignore_index=True
-    )
+    with open(filename) as file:
+        data = json.load(file)
 
-    return flattened_df
+    return load_dict_flatten_into_df(data, json_root)
 
 
-def prepare_attack_dataframe(df, war_data):
+def prepare_attack_dataframe(df, war_data, label="attacks", compact=True):
+    """Cleans, renames and enriches a flattened attacks log for the charts
+    compact -- store the prepared frame compactly, see compact_dataframe"""
     df.drop(columns=["raid", "code"], inplace=True)
-    df = df.replace(r"^\s*$", np.NaN, regex=True)
     df["timestamp_ended"] = pd.to_datetime(df["timestamp_ended"], unit="s")
     df["timestamp_started"] = pd.to_datetime(df["timestamp_started"], unit="s")
     df["attacker_factionname"].replace("N/A", "STEALTHED", inplace=True)
@@ -76,48 +241,75 @@ def prepare_attack_dataframe(df, war_data):
         }
     )
 
-    # Determine if a stealth attack was from a warring faction
+    df = enrich_attack_dataframe(df, war_data)
+    df = df.reset_index(drop=True)
+    if compact:
+        df = compact_dataframe(df, ATTACK_CATEGORY_COLUMNS, label)
+
+    return df
+
+
+def enrich_attack_dataframe(df, war_data):
+    """Adds the derived columns the charts and summary table read, each computed once with vectorized lookups.
+    Stealth attacks in the war are credited to the faction opposing the defender.
+    Can be run again on imported dataframes, the columns are recomputed.
+
+    Columns added:
+    is_war_hit -- attack by one warring faction on the other
+    is_chain_bonus -- hit on a chain bonus count, ex: 10, 25, 50
+    is_assist, is_failed, is_retaliation
+    outcome -- "hit", "assist", "failed" or "other"
+    """
     factions = list(war_data["factions"].keys())
     faction1_id = factions[0]
     faction2_id = factions[1]
     faction1 = war_data["factions"][faction1_id]["name"]
     faction2 = war_data["factions"][faction2_id]["name"]
-    df.loc[
-        df["Attacker"].eq("STEALTHED")
-        & (df["ranked_war"] > 0)
-        & df["Defender Faction"].eq(faction1),
-        "Attacker Faction ID",
-    ] = faction2_id
-    df.loc[
-        df["Attacker"].eq("STEALTHED")
-        & (df["ranked_war"] > 0)
-        & df["Defender Faction"].eq(faction2),
-        "Attacker Faction ID",
-    ] = faction1_id
-    df.loc[
-        df["Attacker"].eq("STEALTHED")
-        & (df["ranked_war"] > 0)
-        & df["Defender Faction"].eq(faction1),
-        "Attacker Faction",
-    ] = faction2
-    df.loc[
+    opponent_names = {faction1: faction2, faction2: faction1}
+    opponent_ids = {faction1: int(faction2_id), faction2: int(faction1_id)}
+
+    # Resolve the attacker faction of stealth attacks
+    defender_faction = df["Defender Faction"].astype("string")
+    stealthed = (
         df["Attacker"].eq("STEALTHED")
         & (df["ranked_war"] > 0)
-        & df["Defender Faction"].eq(faction2),
-        "Attacker Faction",
-    ] = faction1
+        & defender_faction.isin([faction1, faction2])
+    )
+    attacker_faction = df["Attacker Faction"].astype("string")
+    df["Attacker Faction"] = attacker_faction.mask(
+        stealthed, defender_faction.map(opponent_names)
+    )
+    df["Attacker Faction ID"] = (
+        df["Attacker Faction ID"]
+        .astype("int64")
+        .mask(stealthed, defender_faction.map(opponent_ids))
+        .astype("int64")
+    )
 
-    df = df.reset_index(drop=True)
+    attacker_faction = df["Attacker Faction"]
+    is_war_hit = (attacker_faction.eq(faction1) & defender_faction.eq(faction2)) | (
+        attacker_faction.eq(faction2) & defender_faction.eq(faction1)
+    )
+    # String comparisons give nullable booleans, store plain bools
+    df["is_war_hit"] = is_war_hit.fillna(False).astype(bool)
+    df["is_chain_bonus"] = df["chain"].isin(agg.CHAIN_BONUS_HITS)
+
+    outcome = df["result"].astype(object).map(OUTCOME_CLASSES).fillna("other")
+    df["outcome"] = outcome.astype("category")
+    df["is_assist"] = outcome.eq("assist")
+    df["is_failed"] = outcome.eq("failed")
+    df["is_retaliation"] = df["modifiers.retaliation"].eq(agg.RETALIATION_MODIFIER)
 
     return df
 
 
-def prepare_revive_dataframe(df):
+def prepare_revive_dataframe(df, label="revives", compact=True):
+    """Cleans, renames and sorts a flattened revives log for the charts
+    compact -- store the prepared frame compactly, see compact_dataframe"""
     df.drop(
         columns=["target_last_action.status", "target_last_action.timestamp"],
         inplace=True,
     )
-    df = df.replace(r"^\s*$", np.NaN, regex=True)
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
     df = df.rename(
         columns={
@@ -131,63 +323,88 @@ def prepare_revive_dataframe(df):
         }
     )
     df = df.sort_values(by="Time")
+    if compact:
+        df = compact_dataframe(df, REVIVE_CATEGORY_COLUMNS, label)
 
     return df
 
 
-def create_respect_gainloss_graph(df, war_data, return_df=False):
-    """Create bar graph with the respect gained and lost for each faction"""
-    temp_df = df
+def memory_usage_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024**2
 
-    factions = list(war_data["factions"].keys())
-    faction1_id = factions[0]
-    faction2_id = factions[1]
-    faction1 = war_data["factions"][faction1_id]["name"]
-    faction2 = war_data["factions"][faction2_id]["name"]
 
-    respect_gain = (
-        temp_df.groupby(["Attacker Faction"])["respect_gain"].sum().reset_index()
-    )
-    respect_loss = (
-        temp_df.groupby(["Defender Faction"])["respect_loss"].sum().reset_index()
-    )
+def compact_dataframe(df, category_columns, label=None, before=None):
+    """Stores repeated strings as categoricals and narrows integer and multiplier columns.
+    Prints a memory report for the dataframe when a label is given, ex: "attacks"
+    before -- MB the report starts from instead of the size of df, ex: the size of chunks before they were compacted one by one
 
-    respect_gain = respect_gain.rename(columns={"Attacker Faction": "Faction"})
-    respect_loss = respect_loss.rename(columns={"Defender Faction": "Faction"})
+    Returns dataframe
+    """
+    if before is None:
+        before = memory_usage_mb(df) if label else 0
+
+    for column in category_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    for column in df.select_dtypes(include="integer").columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    for column in df.select_dtypes(include="float").columns:
+        if column.startswith(COMPACT_FLOAT_PREFIXES):
+            df[column] = pd.to_numeric(df[column], downcast="float")
+
+    if label:
+        print(
+            "Compacted "
+            + label
+            + ": "
+            + str(round(before, 2))
+            + " MB -> "
+            + str(round(memory_usage_mb(df), 2))
+            + " MB"
+        )
+    return df
 
-    respect_gain = respect_gain.loc[
-        respect_gain["Faction"].eq(faction1) | respect_gain["Faction"].eq(faction2)
-    ]
-    respect_loss = respect_loss.loc[
-        respect_loss["Faction"].eq(faction1) | respect_loss["Faction"].eq(faction2)
-    ]
 
-    rg_count = respect_gain["Faction"].value_counts()
-    rl_count = respect_loss["Faction"].value_counts()
+def append_dataframe(df, new_df):
+    """Appends the rows of a prepared new_df to a prepared df, ex: new events of a running war.
+    Categorical columns keep the categories of both so they stay categoricals, the index continues from df.
 
-    respect = None
+    Returns new dataframe
+    """
+    if df is None or df.shape[0] == 0:
+        return new_df.reset_index(drop=True)
+    return concat_dataframes([df, new_df])
 
-    # Determine which list is longer to make so no players are dropped during the merge
-    if rl_count.shape[0] >= rg_count.shape[0]:
-        respect = respect_gain.merge(respect_loss, how="right")
-    else:
-        respect = respect_gain.merge(respect_loss, how="left")
 
-    respect = respect.fillna(0)
+def concat_dataframes(dfs):
+    """Joins prepared dataframes, ex: the chunks of a download prepared as they arrived.
+    Columns that are categorical in every dataframe get the categories of all of them, so they stay categoricals.
 
-    respect = respect.set_index("Faction")
-    respect.at[faction1, "respect_gain"] = (
-        respect.at[faction1, "respect_gain"]
-        + war_data["factions"][faction1_id]["rewards"]["respect"]
-    )
-    respect.at[faction2, "respect_gain"] = (
-        respect.at[faction2, "respect_gain"]
-        + war_data["factions"][faction2_id]["rewards"]["respect"]
-    )
-    respect = respect.reset_index()
+    Returns new dataframe with a fresh index
+    """
+    dfs = [df.copy(deep=False) for df in dfs]
+    for column in dfs[0].select_dtypes(include="category").columns:
+        if not all(
+            column in df.columns and df[column].dtype.name == "category" for df in dfs
+        ):
+            continue
+        categories = union_categoricals(
+            [df[column] for df in dfs], ignore_order=True
+        ).categories
+        for df in dfs:
+            df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def create_respect_gainloss_graph(df, war_data, return_df=False, aggregates=None):
+    """Create bar graph with the respect gained and lost for each faction"""
+    if aggregates is None:
+        aggregates = agg.WarAggregates(attack_df=df, war_data=war_data)
+
+    respect = aggregates.faction_respect
 
     if return_df:
-        return respect
+        return respect.copy()
 
     fig = go.Figure(
         data=[
@@ -220,29 +437,21 @@ def create_respect_gainloss_graph(df, war_data, return_df=False):
     return fig
 
 
-def create_war_attacks_graph(df, war_data):
+def create_war_attacks_graph(
+    df, war_data, aggregates=None, max_points=LINE_POINT_BUDGET
+):
     """Create line graph with cumulative war attacks over time by faction"""
-    temp_df = df
+    if aggregates is None:
+        aggregates = agg.WarAggregates(attack_df=df, war_data=war_data)
 
-    factions = list(war_data["factions"].keys())
-    faction1_id = factions[0]
-    faction2_id = factions[1]
-    faction1 = war_data["factions"][faction1_id]["name"]
-    faction2 = war_data["factions"][faction2_id]["name"]
-
-    temp_df = temp_df.loc[
-        (
-            temp_df["Attacker Faction"].eq(faction1)
-            & temp_df["Defender Faction"].eq(faction2)
-        )
-        | (
-            temp_df["Attacker Faction"].eq(faction2)
-            & temp_df["Defender Faction"].eq(faction1)
-        )
-    ]
-    temp_df["Cumulative Faction Attacks"] = temp_df.groupby(
-        "Attacker Faction"
-    ).cumcount()
+    faction1, faction2 = aggregates.faction_names
+    temp_df = down.downsample_by(
+        aggregates.war_attacks_over_time,
+        "Attacker Faction",
+        "Time",
+        "Cumulative Faction Attacks",
+        max_points,
+    )
 
     fig = go.Figure()
     fig.add_trace(
@@ -284,31 +493,26 @@ def create_war_attacks_graph(df, war_data):
     return fig
 
 
-def create_assists_graph(df, war_data, return_df=False):
+def create_assists_graph(
+    df, war_data, return_df=False, aggregates=None, max_points=LINE_POINT_BUDGET
+):
     """Create line graph with cumulative assists by the warring factions
     Returns plotly figure"""
-    temp_df = df
+    if aggregates is None:
+        aggregates = agg.WarAggregates(attack_df=df, war_data=war_data)
 
-    factions = list(war_data["factions"].keys())
-    faction1_id = factions[0]
-    faction2_id = factions[1]
-    faction1 = war_data["factions"][faction1_id]["name"]
-    faction2 = war_data["factions"][faction2_id]["name"]
+    temp_df = aggregates.assists_over_time
+    if return_df:
+        return temp_df.copy()
 
-    s = temp_df["Attacker Faction"]
-    s = s.where(
-        ((s == faction1) | (s == faction2)),
-        "Other",
-    )
-    temp_df["Attacker Faction"] = s
-    temp_df = temp_df.loc[
-        temp_df["result"].eq("Assist") & temp_df["Attacker Faction"].ne("Other")
-    ]
-    temp_df["Cumulative Faction Assists"] = temp_df.groupby(
-        "Attacker Faction"
-    ).cumcount()
     fig = px.line(
-        temp_df,
+        down.downsample_by(
+            temp_df,
+            "Attacker Faction",
+            "Time",
+            "Cumulative Faction Assists",
+            max_points,
+        ),
         x="Time",
         y="Cumulative Faction Assists",
         color="Attacker Faction",
@@ -319,50 +523,15 @@ def create_assists_graph(df, war_data, return_df=False):
     return fig
 
 
-def create_net_score_graph(df, basic_faction_info):
+def create_net_score_graph(df, basic_faction_info, aggregates=None):
     """Create bar graph showing net score of the players in the faction"""
-    temp_df = df
-    temp_df = temp_df.loc[
-        (temp_df["ranked_war"] > 0)
-        & (temp_df["respect_gain"] > 0)
-        & (temp_df["chain"].ne(10))
-        & (temp_df["chain"].ne(25))
-        & (temp_df["chain"].ne(50))
-        & (temp_df["chain"].ne(100))
-        & (temp_df["chain"].ne(250))
-        & (temp_df["chain"].ne(500))
-        & (temp_df["chain"].ne(1000))
-        & (temp_df["chain"].ne(2500))
-        & (temp_df["chain"].ne(5000))
-        & (temp_df["chain"].ne(10000))
-        & (temp_df["chain"].ne(25000))
-        & (temp_df["chain"].ne(50000))
-    ]
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            attack_df=df, basic_faction_info=basic_faction_info
+        )
 
-    score_gained = (
-        temp_df.groupby(["Attacker", "Attacker Faction"])["respect_gain"]
-        .sum()
-        .reset_index()
-    )
-    score_ceded = (
-        temp_df.groupby(["Defender", "Defender Faction"])["respect_gain"]
-        .sum()
-        .reset_index()
-    )
-    score_gained = score_gained.rename(
-        columns={
-            "Attacker": "Player",
-            "Attacker Faction": "Faction",
-            "respect_gain": "Score Gained",
-        }
-    )
-    score_ceded = score_ceded.rename(
-        columns={
-            "Defender": "Player",
-            "Defender Faction": "Faction",
-            "respect_gain": "Score Ceded",
-        }
-    )
+    score_gained = aggregates.player_score_gained
+    score_ceded = aggregates.player_score_ceded
 
     sg_count = (
         score_gained["Player"]
@@ -415,50 +584,27 @@ def create_net_score_graph(df, basic_faction_info):
     return fig
 
 
-def attacks_and_losses_player_graph(df, basic_faction_info):
+def attacks_and_losses_player_graph(df, basic_faction_info, aggregates=None):
     """Create bar graph with attacks and losses per player, grouped bars"""
-    temp_df = df
-    attacks_made = (
-        temp_df.loc[:, ["Attacker", "Attacker Faction"]].value_counts().reset_index()
-    )
-    attacks_received = (
-        temp_df.loc[:, ["Defender", "Defender Faction"]].value_counts().reset_index()
-    )
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            attack_df=df, basic_faction_info=basic_faction_info
+        )
 
-    attacks_made = attacks_made.rename(
-        columns={
-            "Attacker": "Player",
-            "Attacker Faction": "Faction",
-            0: "Made",
-        }
-    )
-    attacks_received = attacks_received.rename(
-        columns={
-            "Defender": "Player",
-            "Defender Faction": "Faction",
-            0: "Received",
-        }
-    )
+    attacks_made = aggregates.player_attacks_made
+    attacks_received = aggregates.player_attacks_received
 
-    ar_count = (
-        attacks_received["Player"]
-        .loc[attacks_received["Faction"].eq(basic_faction_info["name"])]
-        .value_counts()
-    )
-    am_count = (
-        attacks_made["Player"]
-        .loc[attacks_received["Faction"].eq(basic_faction_info["name"])]
-        .value_counts()
-    )
-    attack_df = None
-    # Determine which list is longer to make so no players are dropped during the merge
-    if ar_count.shape[0] >= am_count.shape[0]:
-        attack_df = attacks_made.merge(attacks_received, how="right")
-    else:
-        attack_df = attacks_made.merge(attacks_received, how="left")
-
-    attack_df = attack_df.loc[attack_df["Faction"].eq(basic_faction_info["name"])]
-    attack_df = attack_df.fillna(0)
+    # Only our players, stealthed attackers aren't a player
+    our_made = attacks_made.loc[
+        attacks_made["Faction"].eq(basic_faction_info["name"])
+        & attacks_made["Player"].ne("STEALTHED")
+    ]
+    our_received = attacks_received.loc[
+        attacks_received["Faction"].eq(basic_faction_info["name"])
+    ]
+    # Keep players that only made or only received attacks
+    attack_df = our_made.merge(our_received, how="outer", on=["Player", "Faction"])
+    attack_df[["Made", "Received"]] = attack_df[["Made", "Received"]].fillna(0)
     attack_df = attack_df.sort_values(by="Made")
 
     # Works, but no dtick control
@@ -503,13 +649,27 @@ def attacks_and_losses_player_graph(df, basic_faction_info):
     return fig
 
 
-def create_faction_revives_graph(revive_df, basic_faction_info, return_df=False):
+def create_faction_revives_graph(
+    revive_df,
+    basic_faction_info,
+    return_df=False,
+    aggregates=None,
+    max_points=LINE_POINT_BUDGET,
+):
     """Revives over time, line graph"""
-    temp_df = revive_df
-    temp_df = temp_df.loc[temp_df["Target Faction"].eq(basic_faction_info["name"])]
-    temp_df["Cumulative Revives"] = temp_df.groupby("Target Faction").cumcount()
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            revive_df=revive_df, basic_faction_info=basic_faction_info
+        )
+
+    temp_df = aggregates.revives_over_time
+    if return_df:
+        return temp_df.copy()
+
     fig = px.line(
-        temp_df,
+        down.downsample_by(
+            temp_df, "Target Faction", "Time", "Cumulative Revives", max_points
+        ),
         x="Time",
         y="Cumulative Revives",
         color="Target Faction",
@@ -520,32 +680,47 @@ def create_faction_revives_graph(revive_df, basic_faction_info, return_df=False)
     return fig
 
 
-def create_player_revives_over_time_graph(revive_df, basic_faction_info):
-    temp_df = revive_df
-    temp_df = temp_df.loc[temp_df["Target Faction"].eq(basic_faction_info["name"])]
-    temp_df["Cumulative Revives"] = temp_df.groupby("Target").cumcount()
+def create_player_revives_over_time_graph(
+    revive_df, basic_faction_info, aggregates=None, max_points=LINE_POINT_BUDGET
+):
+    """Cumulative revives of each player, scatter graph drawn with WebGL"""
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            revive_df=revive_df, basic_faction_info=basic_faction_info
+        )
+
     fig = px.scatter(
-        temp_df,
+        down.downsample_by(
+            aggregates.player_revives_over_time,
+            "Target",
+            "Time",
+            "Cumulative Revives",
+            max_points,
+        ),
         x="Time",
         y="Cumulative Revives",
         color="Target",
         title="Revives Received over Time by Player",
         height=800,
         width=800,
+        render_mode="webgl",
     )
     return fig
 
 
-def create_player_revives_graph(revive_df, basic_faction_info):
+def create_player_revives_graph(revive_df, basic_faction_info, aggregates=None):
     """Revives per player, stacked bar graph showing success and fails"""
-    temp_df = revive_df
-    temp_df = temp_df.loc[temp_df["Target Faction"].eq(basic_faction_info["name"])]
-    results = temp_df.loc[:, ["Target", "result"]].value_counts().reset_index()
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            revive_df=revive_df, basic_faction_info=basic_faction_info
+        )
+
+    results = aggregates.player_revive_results
     success = results.loc[results["result"].eq("success")]
     failure = results.loc[results["result"].eq("failure")]
 
-    success = success.rename(columns={0: "Success"})
-    failure = failure.rename(columns={0: "Failure"})
+    success = success.rename(columns={"count": "Success"})
+    failure = failure.rename(columns={"count": "Failure"})
 
     success = success.drop("result", axis=1)
     failure = failure.drop("result", axis=1)
@@ -575,151 +750,79 @@ def create_player_revives_graph(revive_df, basic_faction_info):
     return fig
 
 
-def create_faction_summary_table(attack_df, revive_df, war_data, basic_faction_info):
-    """Create a dataframe that contains summary information for each faction in the war"""
-    factions = list(war_data["factions"].keys())
-    faction1_id = factions[0]
-    faction2_id = factions[1]
-    faction1 = war_data["factions"][faction1_id]["name"]
-    faction2 = war_data["factions"][faction2_id]["name"]
+def create_war_figures(dataset):
+    """Creates every chart for a WarDataset, in the order they appear in the report.
+    The charts only read the dataset frames and its shared aggregates.
 
-    temp_df = attack_df.loc[
-        attack_df["Attacker Faction"].eq(faction1)
-        | attack_df["Attacker Faction"].eq(faction2)
-    ]
-
-    summary_df = pd.DataFrame()
-    summary_df["Faction"] = [faction1, faction2]
-    summary_df = summary_df.set_index("Faction")
+    Returns list of plotly figures
+    """
+    return list(iter_war_figures(dataset))
 
-    respect_df = create_respect_gainloss_graph(attack_df, war_data, return_df=True)
-    respect_df["Respect Net"] = respect_df["respect_gain"] - respect_df["respect_loss"]
-    respect_df.rename(
-        columns={"respect_gain": "Respect Gain", "respect_loss": "Respect Loss"},
-        inplace=True,
-    )
-    respect_df = respect_df.set_index("Faction")
-    respect_df.drop(columns={'Respect Gain', 'Respect Loss'}, inplace=True)
 
-    summary_df = summary_df.merge(respect_df, on="Faction")
+def iter_war_figures(dataset):
+    """Same as create_war_figures, but yields each chart as soon as it is created,
+    so it can be written out before the next one is built"""
+    war_data = dataset.war_data
+    basic_faction_info = dataset.basic_faction_info
+    aggregates = dataset.aggregates
 
-    war_attacks = attack_df.loc[
-        (
-            attack_df["Attacker Faction"].eq(faction1)
-            | attack_df["Attacker Faction"].eq(faction2)
-        )
-        & attack_df["ranked_war"].eq(1)
-    ]
-    war_attacks = war_attacks["Attacker Faction"].value_counts().reset_index()
-    war_attacks = war_attacks.rename(
-        columns={"index": "Faction", "Attacker Faction": "War Hits"}
+    # Each chart gets the view it is built from
+    yield create_respect_gainloss_graph(dataset.attacks, war_data, aggregates=aggregates)
+    yield create_war_attacks_graph(dataset.war_hits, war_data, aggregates=aggregates)
+    yield create_assists_graph(dataset.war_attacks, war_data, aggregates=aggregates)
+    yield create_net_score_graph(
+        dataset.attacks, basic_faction_info, aggregates=aggregates
     )
-    war_attacks = war_attacks.set_index("Faction")
-
-    summary_df = summary_df.merge(war_attacks, on="Faction")
-
-    non_war_hits = attack_df.loc[
-        (attack_df["Attacker Faction"].eq(basic_faction_info["name"]))
-        & attack_df["ranked_war"].eq(0)
-        & (
-            attack_df["result"].eq("Attacked")
-            | attack_df["result"].eq("Hospitalized")
-            | attack_df["result"].eq("Mugged")
-            | attack_df["result"].eq("Arrested")
-        )
-    ]
-    non_war_hits = non_war_hits["Attacker Faction"].value_counts().reset_index()
-    non_war_hits = non_war_hits.rename(
-        columns={"index": "Faction", "Attacker Faction": "Non-War Hits"}
-    )
-    non_war_hits = non_war_hits.set_index("Faction")
-
-    summary_df.at[basic_faction_info["name"], "Non-War Hits"] = non_war_hits.at[
-        basic_faction_info["name"], "Non-War Hits"
-    ]
-
-    assist_attacks = attack_df.loc[
-        (
-            attack_df["Attacker Faction"].eq(faction1)
-            | attack_df["Attacker Faction"].eq(faction2)
-        )
-        & attack_df["result"].eq("Assist")
-    ]
-    assist_attacks = assist_attacks["Attacker Faction"].value_counts().reset_index()
-    assist_attacks = assist_attacks.rename(
-        columns={"index": "Faction", "Attacker Faction": "Assists"}
+    yield attacks_and_losses_player_graph(
+        dataset.attacks, basic_faction_info, aggregates=aggregates
     )
-    assist_attacks = assist_attacks.set_index("Faction")
-
-    summary_df = summary_df.merge(assist_attacks, on="Faction")
-
-    retal_attacks = attack_df.loc[
-        (
-            attack_df["Attacker Faction"].eq(faction1)
-            | attack_df["Attacker Faction"].eq(faction2)
-        )
-        & attack_df["modifiers.retaliation"].eq(1.50)
-    ]
-    retal_attacks = retal_attacks["Attacker Faction"].value_counts().reset_index()
-    retal_attacks = retal_attacks.rename(
-        columns={"index": "Faction", "Attacker Faction": "Retaliations"}
+    yield create_faction_revives_graph(
+        dataset.our_revives, basic_faction_info, aggregates=aggregates
     )
-    retal_attacks = retal_attacks.set_index("Faction")
-
-    summary_df = summary_df.merge(retal_attacks, on="Faction")
-
-    failed_attacks = attack_df.loc[
-        (
-            attack_df["Attacker Faction"].eq(faction1)
-            | attack_df["Attacker Faction"].eq(faction2)
-        )
-        & (
-            attack_df["result"].eq("Interrupted")
-            | attack_df["result"].eq("Lost")
-            | attack_df["result"].eq("Escape")
-            | attack_df["result"].eq("Stalemate")
-            | attack_df["result"].eq("Timeout")
-        )
-    ]
-    failed_attacks = failed_attacks["Attacker Faction"].value_counts().reset_index()
-    failed_attacks = failed_attacks.rename(
-        columns={"index": "Faction", "Attacker Faction": "Failed Attacks"}
+    yield create_player_revives_over_time_graph(
+        dataset.our_revives, basic_faction_info, aggregates=aggregates
     )
-    failed_attacks = failed_attacks.set_index("Faction")
-
-    summary_df = summary_df.merge(failed_attacks, on="Faction")
-
-    total_attacks = (
-        temp_df["Attacker Faction"].value_counts().reset_index().set_index("index")
+    yield create_player_revives_graph(
+        dataset.our_revives, basic_faction_info, aggregates=aggregates
     )
 
-    summary_df.at[basic_faction_info["name"], "Total Attacks"] = total_attacks.at[
-        basic_faction_info["name"], "Attacker Faction"
-    ]
 
-    successful_revives = revive_df.loc[
-        (revive_df["Target Faction"].eq(basic_faction_info["name"]))
-        & revive_df["result"].eq("success")
-    ]
-    successful_revives = (
-        successful_revives["Target Faction"].value_counts().reset_index()
+def create_dataset_summary_table(dataset):
+    """Summary table for a WarDataset, see create_faction_summary_table"""
+    return create_faction_summary_table(
+        dataset.attacks,
+        dataset.revives,
+        dataset.war_data,
+        dataset.basic_faction_info,
+        aggregates=dataset.aggregates,
     )
-    successful_revives = successful_revives.rename(columns={"index": "Faction"})
-    successful_revives = successful_revives.set_index("Faction")
 
-    summary_df.at[
-        basic_faction_info["name"], "Successful Revives"
-    ] = successful_revives.iat[0,0]
 
-    failed_revives = revive_df.loc[
-        (revive_df["Target Faction"].eq(basic_faction_info["name"]))
-        & revive_df["result"].eq("failure")
-    ]
-    failed_revives = failed_revives["Target Faction"].value_counts().reset_index()
-    failed_revives = failed_revives.rename(columns={"index": "Faction"})
-    failed_revives = failed_revives.set_index("Faction")
+def create_faction_summary_table(
+    attack_df, revive_df, war_data, basic_faction_info, aggregates=None
+):
+    """Create a dataframe that contains summary information for each faction in the war"""
+    if aggregates is None:
+        aggregates = agg.WarAggregates(
+            attack_df, revive_df, war_data, basic_faction_info
+        )
 
-    summary_df.at[basic_faction_info["name"], "Failed Revives"] = failed_revives.iat[0,0]
+    our_faction = basic_faction_info["name"]
+    respect = aggregates.faction_respect.set_index("Faction")
+    counts = aggregates.faction_counts
+    revive_counts = aggregates.revive_result_counts
+
+    summary_df = pd.DataFrame(index=pd.Index(aggregates.faction_names, name="Faction"))
+    summary_df["Respect Net"] = respect["respect_gain"] - respect["respect_loss"]
+    summary_df["War Hits"] = counts["War Hits"]
+    # Non-war hits, total attacks and revives are only known for our own faction
+    summary_df.at[our_faction, "Non-War Hits"] = counts.at[our_faction, "Non-War Hits"]
+    summary_df["Assists"] = counts["Assists"]
+    summary_df["Retaliations"] = counts["Retaliations"]
+    summary_df["Failed Attacks"] = counts["Failed Attacks"]
+    summary_df.at[our_faction, "Total Attacks"] = counts.at[our_faction, "Total Attacks"]
+    summary_df.at[our_faction, "Successful Revives"] = revive_counts.get("success", 0)
+    summary_df.at[our_faction, "Failed Revives"] = revive_counts.get("failure", 0)
 
     return summary_df.to_html(index_names=False, na_rep="N/A")
 
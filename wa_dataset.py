@@ -0,0 +1,84 @@
+from functools import cached_property
+import wa_aggregates as agg
+
+
+class WarDataset:
+    """The prepared attacks and revives of one war, with the war report and our faction info.
+    The charts and the summary table read it through aggregates and the derived views, ex: war_hits.
+
+    The frames are copied in, so the dataset owns them and nothing else changes them. The properties have no setters,
+    and each derived view is computed once as a frame of its own, so a chart that changes one doesn't affect the others.
+    """
+
+    def __init__(
+        self,
+        attack_df,
+        revive_df,
+        war_data,
+        basic_faction_info,
+        war_id=0,
+        aggregates=None,
+    ):
+        """aggregates -- WarAggregates of these frames to reuse, ex: one kept up to date by wa_live"""
+        if aggregates is not None:
+            self.aggregates = aggregates
+        self._attacks = attack_df.copy()
+        self._revives = revive_df.copy()
+        self._war_data = war_data
+        self._basic_faction_info = basic_faction_info
+        self._war_id = war_id
+
+    @property
+    def attacks(self):
+        return self._attacks
+
+    @property
+    def revives(self):
+        return self._revives
+
+    @property
+    def war_data(self):
+        return self._war_data
+
+    @property
+    def basic_faction_info(self):
+        return self._basic_faction_info
+
+    @property
+    def war_id(self):
+        return self._war_id
+
+    @cached_property
+    def aggregates(self):
+        """Masks, counts and sums shared by the charts, see wa_aggregates"""
+        return agg.WarAggregates(
+            self._attacks, self._revives, self._war_data, self._basic_faction_info
+        )
+
+    @property
+    def faction_names(self):
+        return self.aggregates.faction_names
+
+    @property
+    def our_faction(self):
+        return self._basic_faction_info["name"]
+
+    @cached_property
+    def war_attacks(self):
+        """Attacks made by either warring faction"""
+        return self._attacks.loc[self.aggregates.attacker_in_war]
+
+    @cached_property
+    def war_hits(self):
+        """Attacks made by one warring faction on the other"""
+        return self._attacks.loc[self.aggregates.war_hits]
+
+    @cached_property
+    def our_attacks(self):
+        """Attacks made by our faction"""
+        return self._attacks.loc[self._attacks["Attacker Faction"].eq(self.our_faction)]
+
+    @cached_property
+    def our_revives(self):
+        """Revives received by our faction"""
+        return self.aggregates.our_revives.copy()
@@ -0,0 +1,72 @@
+import numpy as np
+
+# Fewest points a trace is reduced to, the first and last point are always kept
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, max_points):
+    """Largest-Triangle-Three-Buckets downsampling.
+    Splits the points between the first and last into max_points - 2 buckets and keeps the point of each bucket
+    that forms the largest triangle with the point kept before it and the average of the next bucket,
+    so peaks, steps and the overall shape of the line survive.
+
+    x, y -- numeric or datetime arrays, x sorted
+    Returns sorted array of the positions to keep
+    """
+    count = len(x)
+    if max_points is None or max_points >= count or max_points < MIN_POINTS:
+        return np.arange(count)
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").view("int64")
+    # Shift to start at 0 so nanosecond timestamps keep their precision as floats
+    x = x.astype("float64") - float(x[0])
+    y = np.asarray(y, dtype="float64")
+
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = count - 1
+
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = count - 1, count
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return indices
+
+
+def downsample_by(df, group_column, x, y, max_points):
+    """Downsamples the line of each group in df with LTTB.
+    The budget of max_points is shared evenly by the groups, each group keeps at least MIN_POINTS.
+    Groups are kept in the order they first appear, rows within a group keep their order.
+
+    Returns df unchanged if it is already within the budget, otherwise a new dataframe
+    """
+    if max_points is None or df.shape[0] <= max_points:
+        return df
+
+    groups = df.groupby(group_column, observed=True, sort=False).indices
+    per_group = max(max_points // max(len(groups), 1), MIN_POINTS)
+    x_values = df[x].to_numpy()
+    y_values = df[y].to_numpy()
+
+    keep = []
+    for positions in groups.values():
+        kept = lttb_indices(x_values[positions], y_values[positions], per_group)
+        keep.append(positions[kept])
+    keep = np.sort(np.concatenate(keep)) if keep else np.array([], dtype=np.int64)
+    return df.iloc[keep]
+
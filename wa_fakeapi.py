@@ -0,0 +1,235 @@
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import threading
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PORT = 8100
+# Torn's per key limit, calls over it in a 60 second window get error 5
+CALLS_PER_MINUTE = 100
+PAGE_SIZE = 100
+# Field each multipage selection is filtered and ordered by
+TIMESTAMP_FIELDS = {"attacks": "timestamp_started", "revives": "timestamp"}
+FACTION_SELECTIONS = ["basic", "mainnews", "rankedwars"]
+
+ERROR_INCORRECT_KEY = {"error": {"code": 2, "error": "Incorrect key"}}
+ERROR_TOO_MANY_REQUESTS = {"error": {"code": 5, "error": "Too many requests"}}
+ERROR_WRONG_FIELDS = {"error": {"code": 4, "error": "Wrong fields"}}
+
+
+def load_fixtures(folder):
+    """Reads every fixture in folder, each file holds one API response:
+    basic.json, mainnews.json, rankedwars.json -- faction selections
+    rankedwarreport-<war_id>.json -- torn/<war_id>?selections=rankedwarreport
+    attacks.json, revives.json -- every row, sorted by timestamp here so they can be paged
+
+    Returns dict of fixture name -> data"""
+    fixtures = dict()
+    for filename in os.listdir(folder):
+        if filename.endswith(".json"):
+            with open(os.path.join(folder, filename)) as file:
+                fixtures[filename[: -len(".json")]] = json.load(file)
+
+    for selection, timestamp_field in TIMESTAMP_FIELDS.items():
+        if selection in fixtures:
+            rows = fixtures[selection][selection]
+            fixtures[selection] = sorted(
+                rows.items(), key=lambda item: item[1][timestamp_field]
+            )
+    return fixtures
+
+
+def page_rows(sorted_rows, timestamp_field, start, end):
+    """Up to PAGE_SIZE rows with start <= timestamp <= end, oldest first"""
+    page = dict()
+    for key, row in sorted_rows:
+        if row[timestamp_field] < start:
+            continue
+        if row[timestamp_field] > end or len(page) == PAGE_SIZE:
+            break
+        page[key] = row
+    return page
+
+
+class FakeTornAPI(ThreadingHTTPServer):
+    """HTTP server answering API requests from fixtures.
+
+    latency -- seconds added to every response, plus up to the same again at random
+    error_rate -- share of requests answered with error 5 at random, ex: 0.02
+    calls_per_minute -- calls allowed per key in any 60 seconds, None for no limit
+    keys -- keys that are accepted, others get error 2. None accepts every key
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        fixtures,
+        port=DEFAULT_PORT,
+        latency=0,
+        error_rate=0,
+        calls_per_minute=CALLS_PER_MINUTE,
+        keys=None,
+    ):
+        super().__init__(("127.0.0.1", port), FakeTornAPIHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls_per_minute = calls_per_minute
+        self.keys = keys
+        self.calls = dict()  # key -> times of the calls in the last minute
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:" + str(self.server_address[1]) + "/"
+
+    def over_limit(self, key):
+        """Records a call for key, returns True if it is over the per minute limit or hit by a random error"""
+        with self.lock:
+            self.request_count += 1
+            if self.error_rate and random.random() < self.error_rate:
+                return True
+            if self.calls_per_minute is None:
+                return False
+            calls = self.calls.setdefault(key, deque())
+            now = monotonic()
+            while calls and now - calls[0] >= 60:
+                calls.popleft()
+            if len(calls) >= self.calls_per_minute:
+                return True
+            calls.append(now)
+            return False
+
+    def answer(self, path, query):
+        """Returns the response data for a request"""
+        key = query.get("key", [""])[0]
+        if self.keys is not None and key not in self.keys:
+            return ERROR_INCORRECT_KEY
+        if self.over_limit(key):
+            return ERROR_TOO_MANY_REQUESTS
+
+        selection = query.get("selections", [""])[0]
+        parts = [part for part in path.split("/") if part]
+        if parts[:1] == ["torn"] and selection == "rankedwarreport" and len(parts) == 2:
+            return self.fixtures.get("rankedwarreport-" + parts[1], ERROR_WRONG_FIELDS)
+        if parts != ["faction"]:
+            return ERROR_WRONG_FIELDS
+        if selection in FACTION_SELECTIONS:
+            return self.fixtures.get(selection, ERROR_WRONG_FIELDS)
+        if selection in TIMESTAMP_FIELDS and selection in self.fixtures:
+            start = int(query.get("from", ["0"])[0])
+            end = int(query.get("to", ["4070912400"])[0])
+            return {
+                selection: page_rows(
+                    self.fixtures[selection], TIMESTAMP_FIELDS[selection], start, end
+                )
+            }
+        return ERROR_WRONG_FIELDS
+
+
+class FakeTornAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            sleep(server.latency + random.uniform(0, server.latency))
+        url = urlsplit(self.path)
+        body = json.dumps(server.answer(url.path, parse_qs(url.query))).encode()
+        # Torn answers errors with status 200 too
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per page would bury the analyzer's progress output
+
+
+def start_server(fixtures, **options):
+    """Starts a FakeTornAPI in a background thread, port 0 picks a free port.
+    Returns the server, call shutdown() to stop it"""
+    server = FakeTornAPI(fixtures, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def save_fixture(folder, name, data):
+    with open(os.path.join(folder, name + ".json"), "w") as file:
+        json.dump(data, file)
+
+
+def record_fixtures(api_key, war_id, folder):
+    """Saves the real API responses for a war as fixtures. The attacks and revives cover the war period."""
+    import wa_requests as req
+
+    os.makedirs(folder, exist_ok=True)
+    save_fixture(folder, "basic", req.requestData(api_key, 0))
+    save_fixture(folder, "mainnews", req.requestData(api_key, 1))
+    save_fixture(folder, "rankedwars", req.requestData(api_key, 6))
+    war_data = req.requestData(api_key, 2, war_id)
+    save_fixture(folder, "rankedwarreport-" + str(war_id), war_data)
+    war_time_info = war_data["rankedwarreport"]["war"]
+    for mode, selection in ((0, "attacks"), (1, "revives")):
+        save_fixture(
+            folder,
+            selection,
+            req.request_multipage_data(api_key, war_time_info, mode),
+        )
+    print("Saved fixtures for war " + str(war_id) + " in " + folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Torn API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="serve a fixture folder")
+    serve.add_argument("folder")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--latency", type=float, default=0, help="seconds per response")
+    serve.add_argument(
+        "--error-rate", type=float, default=0, help="share of random error 5 responses"
+    )
+    serve.add_argument(
+        "--calls-per-minute",
+        type=int,
+        default=CALLS_PER_MINUTE,
+        help="per key limit, 0 for none",
+    )
+    serve.add_argument(
+        "--keys", help="comma separated keys that are accepted, others get error 2"
+    )
+
+    record = commands.add_parser("record", help="save a real war as fixtures")
+    record.add_argument("war_id")
+    record.add_argument("folder")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        import wa_io as io
+
+        record_fixtures(io.api_key_input(), args.war_id, args.folder)
+        return
+
+    server = FakeTornAPI(
+        load_fixtures(args.folder),
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        calls_per_minute=args.calls_per_minute or None,
+        keys=args.keys.split(",") if args.keys else None,
+    )
+    print("Serving " + args.folder + " at " + server.base_url + ", Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServed " + str(server.request_count) + " requests.")
+
+
+if __name__ == "__main__":
+    main()
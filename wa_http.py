@@ -0,0 +1,68 @@
+import random
+import sys
+import threading
+from time import sleep
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 30)
+MAX_RETRIES = 5
+# Base delay in seconds, doubled on every retry
+RETRY_BACKOFF = 1
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the shared requests session, creating it on first use.
+    Reusing one session keeps connections to the API alive between pages."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests # Imported on first use, it slows down startup
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.headers.update(
+                {
+                    "Accept-Encoding": "gzip, deflate",
+                    "User-Agent": "TornRankedWarAnalyzer",
+                }
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get(url):
+    """GET url through the shared session.
+    Retries server errors, timeouts and dropped connections with jittered exponential backoff.
+    Returns the response, exits if every attempt fails."""
+    import requests
+
+    reason = None
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            reason = "HTTP " + str(response.status_code)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            reason = type(e).__name__
+
+        if attempt < MAX_RETRIES:
+            delay = random.uniform(0, RETRY_BACKOFF * 2**attempt) # Full jitter
+            print(
+                "Request failed ("
+                + reason
+                + "), retrying in "
+                + str(round(delay, 1))
+                + " seconds.."
+            )
+            sleep(delay)
+
+    print("Request failed after " + str(MAX_RETRIES + 1) + " attempts (" + reason + "), exiting..")
+    sys.exit()
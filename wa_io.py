@@ -1,9 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from string import punctuation
+import os
 import sys
 from tabulate import tabulate
 from time import time
-import datetime
-from pandas import read_csv
+import wa_keypool as kp
+
+# pandas, plotly and pyarrow are imported where they are used, so the prompts come up
+# without waiting for them. waranalyzer loads them in the background meanwhile.
+
+# Columns restored to datetimes when importing csv files
+CSV_TIME_COLUMNS = ["Time", "Time Started"]
+# Static image export settings for display modes 1 and 2, format can be png, jpg, webp, svg or pdf
+IMAGE_FORMAT = "png"
+IMAGE_SCALE = 1
+# Worker processes rendering images, None uses one per cpu core
+IMAGE_WORKERS = None
+# "cdn" links plotly.js in the html report, "inline" embeds it so the report works offline
+REPORT_PLOTLYJS = "cdn"
+# "binary" stores chart numbers and times in the html report as base64 typed arrays, "json" as plain text
+REPORT_ENCODING = "binary"
 
 
 def intro():
@@ -12,28 +28,30 @@ def intro():
 
 
 def api_key_input():
-    """Request API Key from user using input. Performs basic checks to validate key.
-    Returns a string containing the API key."""
+    """Request API Keys from user using input. Performs basic checks to validate each key.
+    Several keys of the faction's members can be entered, separated by commas or spaces,
+    downloads then use every key's rate limit. Returns a wa_keypool.KeyPool of the keys."""
 
     print("An API key with faction API access is required.")
+    print("More keys of the faction, separated by commas, make downloads faster.")
     key_input = input("Enter Key: ")
-    key_input.strip()
-    print("API Key: " + key_input)
-
-    if len(key_input) == 16:
-        for char in punctuation:
-            if char in key_input:
-                print("Invalid Key. Exiting..")
-                sys.exit()
-        return key_input
-    else:
+    keys = key_input.replace(",", " ").split()
+    print("API Key: " + ", ".join(keys))
+
+    if not keys:
         print("Invalid Key. Exiting..")
         sys.exit()
+    for key in keys:
+        if len(key) != 16 or any(char in key for char in punctuation):
+            print("Invalid Key " + key + ". Exiting..")
+            sys.exit()
+    return kp.KeyPool(keys)
 
 
 def war_selection_table(basic_faction_info, war_list_formatted):
     """Displays faction info and a table containing recent wars.
-    Prompts for a war selection. Returns ID of selected war."""
+    Prompts for a war selection: one war, every listed war, or a range of listed War IDs.
+    Returns list of selected war IDs, more than one selects batch mode."""
 
     print("\nFaction Info:")
     print(
@@ -55,15 +73,35 @@ def war_selection_table(basic_faction_info, war_list_formatted):
     )
 
     print("Enter a war to analyze, # or WarID.")
-    selected_war = int(input("> "))
+    print("Batch mode: enter all for every listed war, or a range of WarIDs, ex: 12000-12500")
+    selection = input("> ").strip().lower()
+    if selection == "all":
+        return [war[1] for war in war_list_formatted]
+    if "-" in selection:
+        try:
+            first, last = (int(war_id) for war_id in selection.split("-"))
+        except ValueError:
+            print("Invalid range, must be two WarIDs, ex: 12000-12500")
+            sys.exit()
+        war_ids = [war[1] for war in war_list_formatted if first <= int(war[1]) <= last]
+        if war_ids:
+            return war_ids
+        print("No listed wars in that range.")
+        sys.exit()
+
+    try:
+        selected_war = int(selection)
+    except ValueError:
+        print("Invalid selection.")
+        sys.exit()
     if selected_war >= 0 and selected_war < len(war_list_formatted):
         war_id = war_list_formatted[selected_war][1]
-        return war_id
+        return [war_id]
     else:
         for war in war_list_formatted:
             if selected_war == int(war[1]):
                 war_id = selected_war
-                return war_id
+                return [war_id]
 
     print("Invalid selection.")
     sys.exit()
@@ -72,7 +110,7 @@ def war_selection_table(basic_faction_info, war_list_formatted):
 def download_or_import_prompt():
     source = None
     print(
-        "\nChoose a data source:\n0: Download from Torn API (also creates csv files)\n1: Import war csv files (must be in same folder as program)"
+        "\nChoose a data source:\n0: Download from Torn API (also creates csv files)\n1: Import saved war files (.feather or .csv, must be in same folder as program)"
     )
     source = input("> ")
     try:
@@ -87,12 +125,50 @@ def download_or_import_prompt():
         sys.exit()
 
 
+def war_filename(war_id, type_str, extension):
+    return "war-" + str(war_id) + "-" + type_str + extension
+
+
 def export_df_to_csv(df, war_id, type_str):
-    df.to_csv("war-" + str(war_id) + "-" + type_str + ".csv")
-    print("Saved " + "war-" + str(war_id) + "-" + type_str + ".csv for future use..")
+    df.to_csv(war_filename(war_id, type_str, ".csv"))
+    print("Saved " + war_filename(war_id, type_str, ".csv") + " for future use..")
+
+
+def export_df_to_feather(df, war_id, type_str):
+    """Saves the prepared dataframe as an uncompressed feather file, which keeps all dtypes
+    and can be memory mapped when imported. Skipped if pyarrow is not installed."""
+    if load_feather() is None:
+        return
+    filename = war_filename(war_id, type_str, ".feather")
+    df.reset_index(drop=True).to_feather(filename, compression="uncompressed")
+    print("Saved " + filename + " for future use..")
+
+
+def import_war_df(war_id, type_str):
+    """Imports a prepared war dataframe, ex: type_str "attacks".
+    Uses the feather file when it exists and pyarrow is installed, otherwise the csv file."""
+    filename = war_filename(war_id, type_str, ".feather")
+    feather = load_feather()
+    if feather is not None and os.path.exists(filename):
+        df = feather.read_table(filename, memory_map=True).to_pandas()
+        print("Imported " + filename + " ..")
+        return df
+
+    return import_csv_to_df(war_filename(war_id, type_str, ".csv"))
+
+
+def load_feather():
+    """Returns pyarrow.feather, or None if pyarrow is not installed"""
+    try:
+        import pyarrow.feather as feather # Optional, enables the binary war files
+    except ImportError:
+        return None
+    return feather
 
 
 def import_csv_to_df(filepath):
+    from pandas import read_csv, to_datetime
+
     df = None
     try:
         df = read_csv(filepath, index_col=0)
@@ -101,6 +177,9 @@ def import_csv_to_df(filepath):
             "Files not found, please make sure both wardata csv files are in the same folder as the program.\nIf you do not have the files, run the program in download mode to create them."
         )
         sys.exit()
+    for column in CSV_TIME_COLUMNS:
+        if column in df.columns:
+            df[column] = to_datetime(df[column])
     print("Imported " + filepath + " ..")
     return df
 
@@ -123,58 +202,103 @@ def display_mode_prompt():
         sys.exit()
 
 
-def display_figs(figs, display_mode, war_data, war_id, summary_table):
+def display_figs(
+    figs, display_mode, war_data, war_id, summary_table, image_workers=IMAGE_WORKERS
+):
     """Determine how to display a graph figure
+    figs can be a generator, each figure is written out as soon as it is created.
+    image_workers -- processes rendering images in modes 1 and 2, see export_images
     Modes:
     0 -- Save to single html file
     1 -- Save to images(png)
     2 -- Save to images and html file
     3 -- Display in browser(buggy, not recommended)
     """
-    div_list = []
-    for fig in figs:
-        fig_title = fig.layout.title.text.replace(" ", "_")
-        if display_mode == 0:
-            div_list.append(fig.to_html(full_html=False, include_plotlyjs="cdn"))
-            print("Added " + fig_title + " chart to the html file.")
-        elif display_mode == 1:
-            fig.write_image("war-" + str(war_id) + "-" + fig_title + ".png")
-            print("Saved " + "war-" + str(war_id) + "-" + fig_title + ".png")
-        elif display_mode == 2:
-            div_list.append(fig.to_html(full_html=False, include_plotlyjs="cdn"))
-            print("Added " + fig_title + " chart to the html file.")
-            fig.write_image("war-" + str(war_id) + "-" + fig_title + ".png")
-            print("Saved " + "war-" + str(war_id) + "-" + fig_title + ".png")
-        elif display_mode == 3:
-            fig.show()
-            print("Displayed " + fig_title + " chart in browser.")
+    import wa_report as rep
 
+    report = None
     if display_mode == 0 or display_mode == 2:
-        save_to_single_html_file(div_list, war_data, war_id, summary_table)
-
-
-def save_to_single_html_file(div_list, war_data, war_id, summary_table):
-    """Adds information headers and saves all created charts to one html file"""
-    factions = list(war_data["factions"].keys())
-    html_string = (
-        "<html><head><h1>"
-        + war_data["factions"][factions[0]]["name"]
-        + " vs "
-        + war_data["factions"][factions[1]]["name"]
-        + "</h1>"
-        + "<h2>"
-        + str(datetime.datetime.fromtimestamp(war_data["war"]["start"]))
-        + "</h2>"
-        + summary_table
-        + "</head>"
-    )
-    for div in div_list:
-        html_string += div
-        html_string += "<hr>"
+        report = rep.ReportWriter(
+            "war-" + str(war_id) + "-" + "charts-" + str(int(time())) + ".html",
+            include_plotlyjs=REPORT_PLOTLYJS,
+            encoding=REPORT_ENCODING,
+        )
+        report.write_header(war_data, summary_table)
+        figs = _add_figs_to_report(figs, report)
+
+    if display_mode == 1 or display_mode == 2:
+        export_images(figs, war_id, workers=image_workers)
+    else:
+        for fig in figs: # Also drives the report writer in mode 0
+            if display_mode == 3:
+                fig.show()
+                print(
+                    "Displayed "
+                    + fig.layout.title.text.replace(" ", "_")
+                    + " chart in browser."
+                )
+
+    if report is not None:
+        report.close()
+        print("Saved " + report.filename + " file.")
+        if report.encoding == "binary":
+            print(
+                "Chart data: "
+                + str(round(report.figure_bytes / 1024))
+                + " KB as typed arrays, "
+                + str(round(report.json_bytes / 1024))
+                + " KB as JSON text."
+            )
+
+
+def _add_figs_to_report(figs, report):
+    """Writes each figure to the report, then passes it on"""
+    for fig in figs:
+        report.add_figure(fig)
+        print("Added " + fig.layout.title.text.replace(" ", "_") + " chart to the html file.")
+        yield fig
+
+
+def _start_image_worker(image_format):
+    """Renders an empty figure so the worker's image renderer is running before the first real figure.
+    The renderer process stays alive and is reused for every figure the worker gets."""
+    import plotly.graph_objects as go
+
+    go.Figure().to_image(format=image_format)
+
+
+def _write_image(fig_json, filename, image_format, scale):
+    import plotly.io as pio
+
+    pio.from_json(fig_json).write_image(filename, format=image_format, scale=scale)
+    return filename
+
 
-    html_string += "</html>"
-    t = int(time())
-    with open("war-" + str(war_id) + "-" + "charts-" + str(t) + ".html", "w") as file:
-        file.write(html_string)
+def export_images(
+    figs, war_id, image_format=IMAGE_FORMAT, scale=IMAGE_SCALE, workers=IMAGE_WORKERS
+):
+    """Saves every figure as a static image, rendered in parallel by a pool of worker processes.
+    figs can be a generator, each figure is sent to the pool as soon as it is created.
+    Files are named war-<war_id>-<chart_title>.<image_format>"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if hasattr(figs, "__len__"):
+        workers = min(workers, len(figs))
+    workers = max(1, workers)
 
-    print("Saved " + "war-" + str(war_id) + "-" + "charts-" + str(t) + ".html file.")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_start_image_worker,
+        initargs=(image_format,),
+    ) as pool:
+        futures = []
+        for fig in figs:
+            fig_title = fig.layout.title.text.replace(" ", "_")
+            filename = "war-" + str(war_id) + "-" + fig_title + "." + image_format
+            futures.append(
+                pool.submit(
+                    _write_image, fig.to_json(), filename, image_format, scale
+                )
+            )
+        for future in as_completed(futures):
+            print("Saved " + future.result())
@@ -0,0 +1,72 @@
+import threading
+import wa_ratelimit as rl
+
+# Torn API errors that stop a key from working until its owner acts, the key is taken out of the pool
+KEY_ERROR_CODES = {
+    2: "Incorrect key",
+    7: "Incorrect ID-entity relation",  # The key owner has no faction API access
+    10: "Key owner is in federal jail",
+    13: "Key disabled due to owner inactivity",
+    14: "Daily read limit reached",
+    16: "Access level of this key is not high enough",
+    18: "Key paused by owner",
+}
+
+
+def mask(key):
+    """Last characters of a key, enough to tell keys apart in messages"""
+    return "..." + key[-4:]
+
+
+class KeyPool:
+    """API keys of one faction that requests are spread over. Torn limits calls per key,
+    so every key adds its own budget: each one has its wa_ratelimit limiter,
+    and choose picks the key with the most calls left.
+    Keys that return one of KEY_ERROR_CODES are disabled for the rest of the run.
+
+    keys -- API keys, duplicates are dropped. The first key's faction is the one analyzed
+    """
+
+    def __init__(self, keys):
+        self.keys = list(dict.fromkeys(keys))
+        self.disabled = dict()  # key -> error message
+        self.lock = threading.Lock()
+
+    def healthy_keys(self):
+        with self.lock:
+            return [key for key in self.keys if key not in self.disabled]
+
+    def choose(self):
+        """Returns the healthy key with the most calls left, or None if every key is disabled"""
+        keys = self.healthy_keys()
+        if not keys:
+            return None
+        return max(keys, key=lambda key: rl.get_limiter(key).available())
+
+    def disable(self, key, error):
+        """Takes a key out of the pool after an error that stops it working, ex: one of KEY_ERROR_CODES.
+        Returns the number of healthy keys left"""
+        with self.lock:
+            if key not in self.disabled:
+                self.disabled[key] = error
+                left = len(self.keys) - len(self.disabled)
+                if left:
+                    print(
+                        "API key " + mask(key) + " disabled (" + error + "), "
+                        + str(left) + " left.."
+                    )
+            return len(self.keys) - len(self.disabled)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def as_pool(api_key):
+    """Returns api_key if it is a KeyPool, otherwise the shared pool of that single key"""
+    if isinstance(api_key, KeyPool):
+        return api_key
+    with _pools_lock:
+        if api_key not in _pools:
+            _pools[api_key] = KeyPool([api_key])
+        return _pools[api_key]
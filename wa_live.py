@@ -0,0 +1,166 @@
+from time import sleep, time
+import wa_aggregates as agg
+import wa_data_handler as dh
+import wa_dataset as ds
+import wa_io as io
+import wa_processing as proc
+import wa_report as rep
+import wa_requests as req
+
+# Minutes between polls for new events, the report is rewritten after each poll
+WATCH_INTERVAL_MINUTES = 5
+# Attacks are listed by their start time but only once they finish, and a fight can last up to 5 minutes.
+# Each poll starts this many seconds before the last attack so attacks that were still running aren't lost
+LIVE_OVERLAP_SECONDS = 10 * 60
+
+
+class LiveWar:
+    """Attacks and revives of a running war, kept up to date by polling only the events since the last poll.
+    New events are prepared on their own and appended to the frames, and the aggregates are
+    extended with them instead of being computed again from every event."""
+
+    def __init__(self, api_key, war_id, war_data, basic_faction_info):
+        self.api_key = api_key
+        self.war_id = war_id
+        self.war_data = war_data
+        self.basic_faction_info = basic_faction_info
+        self.attack_df = None
+        self.revive_df = None
+        self.aggregates = None
+        # Keys of every event so far, pages and polls overlap
+        self.attack_keys = set()
+        self.revive_keys = set()
+        self.attack_marker = war_data["war"]["start"]
+        self.revive_marker = war_data["war"]["start"]
+
+    @property
+    def has_ended(self):
+        return req.war_has_ended(self.war_data["war"])
+
+    def _request_new_rows(self, mode, time_marker, known_keys, overlap=0):
+        """Returns (rows since overlap seconds before time_marker that aren't in known_keys,
+        time marker for the next poll)"""
+        end = int(time())
+        if self.has_ended:
+            end = self.war_data["war"]["end"]
+        start = max(self.war_data["war"]["start"], time_marker - overlap)
+        rows = dict()
+        for new_rows, page_marker in req.iter_new_rows(
+            self.api_key, mode, start, end, known_keys
+        ):
+            rows.update(new_rows)
+            time_marker = max(time_marker, page_marker)
+        return rows, time_marker
+
+    def poll(self):
+        """Requests and appends the events since the last poll, then extends the aggregates.
+        Returns (number of new attacks, number of new revives)"""
+        new_attacks, self.attack_marker = self._request_new_rows(
+            0, self.attack_marker, self.attack_keys, overlap=LIVE_OVERLAP_SECONDS
+        )
+        new_revives, self.revive_marker = self._request_new_rows(
+            1, self.revive_marker, self.revive_keys
+        )
+
+        if new_attacks:
+            new_df = dh.load_dict_flatten_into_df({"attacks": new_attacks}, "attacks")
+            new_df = dh.prepare_attack_dataframe(new_df, self.war_data)
+            self.attack_df = dh.append_dataframe(self.attack_df, new_df)
+        if new_revives:
+            new_df = dh.load_dict_flatten_into_df({"revives": new_revives}, "revives")
+            new_df = dh.prepare_revive_dataframe(new_df)
+            self.revive_df = dh.append_dataframe(self.revive_df, new_df)
+
+        if self.aggregates is None:
+            self.aggregates = agg.WarAggregates(
+                self.attack_df, self.revive_df, self.war_data, self.basic_faction_info
+            )
+        else:
+            self.aggregates.extend(self.attack_df, self.revive_df)
+        return len(new_attacks), len(new_revives)
+
+    def update_war_info(self):
+        """Refreshes the war times, the end time is only known once the war is over"""
+        data = req.requestData(self.api_key, 6, use_cache=False)
+        war = data["rankedwars"].get(str(self.war_id))
+        if war is not None:
+            self.war_data["war"] = war["war"]
+
+    def write_report(self, filename, refresh_seconds=None):
+        """Writes the summary table and charts of the events so far.
+        Returns False if there are no attacks or revives yet to chart"""
+        if self.attack_df is None or self.revive_df is None:
+            return False
+        dataset = ds.WarDataset(
+            self.attack_df,
+            self.revive_df,
+            self.war_data,
+            self.basic_faction_info,
+            self.war_id,
+            aggregates=self.aggregates,
+        )
+        with rep.ReportWriter(
+            filename,
+            include_plotlyjs=io.REPORT_PLOTLYJS,
+            encoding=io.REPORT_ENCODING,
+            refresh_seconds=refresh_seconds,
+        ) as report:
+            report.write_header(self.war_data, dh.create_dataset_summary_table(dataset))
+            for fig in dh.iter_war_figures(dataset):
+                report.add_figure(fig)
+        return True
+
+
+def find_active_war(api_key):
+    """Returns (war_id, war_data) of the faction's running war, or None"""
+    return proc.extract_active_war(req.requestData(api_key, 6), time())
+
+
+def watch_war(
+    api_key, war_id, war_data, basic_faction_info, interval_minutes=WATCH_INTERVAL_MINUTES
+):
+    """Polls a running war every interval_minutes and rewrites its html report, which reloads itself in the browser.
+    Stops with Ctrl+C, or once the war has ended, after saving the war files like a download."""
+    live = LiveWar(api_key, war_id, war_data, basic_faction_info)
+    filename = "war-" + str(war_id) + "-live.html"
+    interval = interval_minutes * 60
+    print(
+        "Watching war "
+        + str(war_id)
+        + ", updating "
+        + filename
+        + " every "
+        + str(interval_minutes)
+        + " minutes. Press Ctrl+C to stop."
+    )
+    try:
+        while True:
+            started = time()
+            new_attacks, new_revives = live.poll()
+            print(
+                "Received "
+                + str(new_attacks)
+                + " new attacks and "
+                + str(new_revives)
+                + " new revives.."
+            )
+            if live.write_report(filename, refresh_seconds=interval):
+                print("Updated " + filename + ".")
+            else:
+                print("Waiting for the first attacks and revives..")
+
+            if live.has_ended:
+                break
+            sleep(max(0, interval - (time() - started)))
+            live.update_war_info()
+    except KeyboardInterrupt:
+        print("\nStopped watching war " + str(war_id) + ".")
+        return live
+
+    print("War " + str(war_id) + " has ended.")
+    if live.attack_df is not None and live.revive_df is not None:
+        io.export_df_to_feather(live.attack_df, war_id, "attacks")
+        io.export_df_to_csv(live.attack_df, war_id, "attacks")
+        io.export_df_to_feather(live.revive_df, war_id, "revives")
+        io.export_df_to_csv(live.revive_df, war_id, "revives")
+    return live
@@ -0,0 +1,201 @@
+import os
+import wa_aggregates as agg
+import wa_archive as arc
+import wa_data_handler as dh
+import wa_dataset as ds
+import wa_io as io
+import wa_profile as prof
+import wa_requests as req
+
+# Downloaded rows that are flattened and prepared together while a war downloads
+STREAM_CHUNK_ROWS = 1000
+
+
+def download_war(api_key, war_time_info, scope, quiet=False):
+    """Downloads the attacks and revives of a war period into the archive, only the parts it doesn't have yet.
+    scope -- faction the logs belong to, ex: basic_faction_info["ID"]
+    quiet -- don't print progress messages"""
+    for mode in req.MULTIPAGE_MODES:
+        for _ in req.iter_archive_download(api_key, war_time_info, mode, scope, quiet):
+            pass
+
+
+def load_archived_war(war_data, scope, war_id):
+    """Prepares a downloaded war from a range query of the archive for the war period,
+    then saves the war files for future imports. Returns (attack_df, revive_df)"""
+    start = war_data["war"]["start"]
+    end = war_data["war"]["end"]
+    attack_df = arc.load_frame("attacks", scope, start, end)
+    attack_df = dh.prepare_attack_dataframe(attack_df, war_data)
+    revive_df = arc.load_frame("revives", scope, start, end)
+    revive_df = dh.prepare_revive_dataframe(revive_df)
+    save_war(attack_df, revive_df, war_id)
+    return attack_df, revive_df
+
+
+def _chunks(pages, chunk_rows):
+    """Groups downloaded pages into dicts of at least chunk_rows rows, the last one can be smaller"""
+    chunk = dict()
+    for page in pages:
+        chunk.update(page)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = dict()
+    if chunk:
+        yield chunk
+
+
+def download_and_prepare_war(api_key, war_id, war_data, basic_faction_info):
+    """Downloads a war and prepares it while the pages arrive.
+    The events the archive already has for the war period are read first, in chunks of STREAM_CHUNK_ROWS,
+    then the rest is downloaded. Every chunk is prepared and added to the summary totals, then the raw rows are dropped.
+    So the downloaded dict, the flattened frame and the prepared frame are never all in memory,
+    and the totals are ready as soon as the last page lands. Saves the war files like load_archived_war.
+
+    Returns (attack_df, revive_df, aggregates), aggregates is the WarAggregates of the two frames
+    """
+    aggregates = agg.WarAggregates(
+        war_data=war_data, basic_faction_info=basic_faction_info
+    )
+
+    print("Requesting Faction Attacks Log from war period..")
+    attack_df = _download_and_prepare_log(
+        api_key, war_data, basic_faction_info["ID"], 0, aggregates
+    )
+    print("Requesting Faction Revives Log from war period..")
+    revive_df = _download_and_prepare_log(
+        api_key, war_data, basic_faction_info["ID"], 1, aggregates
+    )
+
+    # The totals were added up from the chunks, the other parts are computed from the whole frames
+    aggregates.attack_df = attack_df
+    aggregates.revive_df = revive_df
+    save_war(attack_df, revive_df, war_id)
+    return attack_df, revive_df, aggregates
+
+
+def _download_and_prepare_log(api_key, war_data, scope, mode, aggregates):
+    """Prepares the archived and the downloaded events of one log in chunks, see download_and_prepare_war.
+    Returns the prepared frame"""
+    type_str = req.MULTIPAGE_MODES[mode][0]
+    war_time_info = war_data["war"]
+    chunks = []
+    sizes = []  # MB of each chunk before it was compacted
+    # Read completely before the download adds to the archive
+    archived = arc.iter_frames(
+        type_str, scope, war_time_info["start"], war_time_info["end"], STREAM_CHUNK_ROWS
+    )
+    for chunk in prof.iter_stage(archived, "load archived " + type_str):
+        with prof.stage("prepare " + type_str, rows=len(chunk)):
+            chunks.append(_prepare_chunk(chunk, type_str, war_data, aggregates, sizes))
+
+    pages = req.iter_archive_download(api_key, war_time_info, mode, scope)
+    for rows in prof.iter_stage(_chunks(pages, STREAM_CHUNK_ROWS), "download " + type_str):
+        with prof.stage("prepare " + type_str, rows=len(rows)):
+            chunk = dh.load_dict_flatten_into_df({type_str: rows}, type_str)
+            chunks.append(_prepare_chunk(chunk, type_str, war_data, aggregates, sizes))
+
+    if not chunks:
+        # A war without any revives, ex: the archive and the download had no rows
+        chunks.append(
+            _prepare_chunk(
+                dh.empty_log_dataframe(type_str), type_str, war_data, aggregates, sizes
+            )
+        )
+    with prof.stage("join " + type_str) as stage:
+        if type_str == "attacks":
+            df = _join_chunks(chunks, dh.ATTACK_CATEGORY_COLUMNS, type_str, sum(sizes))
+        else:
+            df = _join_chunks(chunks, dh.REVIVE_CATEGORY_COLUMNS, type_str, sum(sizes))
+        stage["rows"] = len(df)
+    return df
+
+
+def _prepare_chunk(chunk, type_str, war_data, aggregates, sizes):
+    """Prepares and compacts a flattened chunk quietly and adds it to the totals.
+    Appends its size before compacting to sizes, for the memory report of _join_chunks"""
+    if type_str == "attacks":
+        chunk = dh.prepare_attack_dataframe(chunk, war_data, compact=False)
+        sizes.append(dh.memory_usage_mb(chunk))
+        chunk = dh.compact_dataframe(chunk, dh.ATTACK_CATEGORY_COLUMNS)
+        aggregates.add_rows(new_attacks=chunk)
+    else:
+        chunk = dh.prepare_revive_dataframe(chunk, compact=False)
+        sizes.append(dh.memory_usage_mb(chunk))
+        chunk = dh.compact_dataframe(chunk, dh.REVIVE_CATEGORY_COLUMNS)
+        aggregates.add_rows(new_revives=chunk)
+    return chunk
+
+
+def _join_chunks(chunks, category_columns, label, size_before):
+    """Joins compacted chunks into one frame in time order.
+    Compacts it again, the join can widen columns the chunks narrowed differently,
+    and reports the memory saved from size_before, the MB of the chunks before they were compacted"""
+    df = dh.concat_dataframes(chunks)
+    df = df.sort_values(by="Time", kind="stable").reset_index(drop=True)
+    return dh.compact_dataframe(df, category_columns, label, before=size_before)
+
+
+def save_war(attack_df, revive_df, war_id):
+    """Saves the prepared war files for future imports"""
+    with prof.stage("save war files", rows=len(attack_df) + len(revive_df)):
+        io.export_df_to_feather(attack_df, war_id, "attacks")
+        io.export_df_to_csv(attack_df, war_id, "attacks")
+        io.export_df_to_feather(revive_df, war_id, "revives")
+        io.export_df_to_csv(revive_df, war_id, "revives")
+
+
+def import_war(war_id, war_data):
+    """Imports the saved war files. Returns (attack_df, revive_df)"""
+    with prof.stage("import attacks") as stage:
+        # Files saved by older versions don't have the derived columns
+        attack_df = dh.enrich_attack_dataframe(io.import_war_df(war_id, "attacks"), war_data)
+        attack_df = dh.compact_dataframe(attack_df, dh.ATTACK_CATEGORY_COLUMNS, "attacks")
+        stage["rows"] = len(attack_df)
+    with prof.stage("import revives") as stage:
+        revive_df = dh.compact_dataframe(
+            io.import_war_df(war_id, "revives"), dh.REVIVE_CATEGORY_COLUMNS, "revives"
+        )
+        stage["rows"] = len(revive_df)
+    return attack_df, revive_df
+
+
+def war_files_saved(war_id):
+    """True if both war files were saved by an earlier download"""
+    for type_str in ("attacks", "revives"):
+        if not (
+            os.path.exists(io.war_filename(war_id, type_str, ".feather"))
+            or os.path.exists(io.war_filename(war_id, type_str, ".csv"))
+        ):
+            return False
+    return True
+
+
+def write_war_report(
+    attack_df,
+    revive_df,
+    war_data,
+    basic_faction_info,
+    war_id,
+    display_mode,
+    image_workers=io.IMAGE_WORKERS,
+    aggregates=None,
+):
+    """Creates the summary table and charts, then saves or displays them, see wa_io.display_figs
+    aggregates -- WarAggregates of the frames to reuse, ex: from download_and_prepare_war"""
+    # Shared by every chart and the summary table, charts only read from it
+    dataset = ds.WarDataset(
+        attack_df, revive_df, war_data, basic_faction_info, war_id, aggregates
+    )
+    with prof.stage("summary table"):
+        summary_table = dh.create_dataset_summary_table(dataset)
+    # Charts are created one at a time while the report is written
+    figs = prof.iter_stage(
+        dh.iter_war_figures(dataset),
+        lambda fig: "chart: " + fig.layout.title.text,
+        rows=None,
+    )
+    with prof.stage("display_figs"):
+        io.display_figs(
+            figs, display_mode, war_data, war_id, summary_table, image_workers=image_workers
+        )
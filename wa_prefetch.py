@@ -0,0 +1,143 @@
+import threading
+import wa_requests as req
+
+# Listed wars whose reports are requested while the war list waits for a selection, newest first
+PREFETCH_WAR_REPORTS = 5
+# Pages of each log downloaded ahead for the war most likely to be analyzed
+PREFETCH_PAGES = 20
+# Seconds stop waits for the request in progress, a slower one finishes in the background
+STOP_TIMEOUT = 2
+
+
+class Prefetcher:
+    """Makes the requests a run will most likely need while the prompts wait on the user.
+    While the war list is shown it requests the reports of the newest wars, then the first pages of the
+    attacks and revives of the newest war. Once a war is selected the pages of that war are downloaded instead.
+
+    Pages go to the archive, so the real download skips them. Pages of a war that isn't analyzed now
+    stay archived for the next time it is, or a war next to it, is downloaded.
+    scope -- faction the logs belong to, ex: basic_faction_info["ID"]
+    """
+
+    def __init__(self, api_key, scope):
+        self.api_key = api_key
+        self.scope = scope
+        self.war_reports = dict()  # war_id -> ranked war report data
+        self.report_events = dict()  # war_id -> Event set once the prefetch of its report ended
+        self.page_war_id = None  # War whose pages are being prefetched
+        self.stop_event = None  # Event of the running prefetch, a new one per run
+        self.thread = None
+        self.stopped_threads = []  # Stopped runs that were still finishing a request
+
+    def start(self, war_ids):
+        """Starts prefetching the reports of the first listed wars and the pages of the first one"""
+        war_ids = [str(war_id) for war_id in war_ids]
+        self._run(war_ids[:PREFETCH_WAR_REPORTS], war_ids[0] if war_ids else None)
+
+    def select(self, war_id):
+        """Switches the page prefetch to the selected war, if it isn't the one being prefetched"""
+        war_id = str(war_id)
+        if war_id == self.page_war_id:
+            return
+        self.stop()
+        self._run([war_id], war_id)
+
+    def war_report(self, war_id):
+        """Returns the prefetched report of a war, waiting for it if it is being requested, or requests it"""
+        war_id = str(war_id)
+        event = self.report_events.get(war_id)
+        if event is not None:
+            event.wait()
+        data = self.war_reports.get(war_id)
+        if data is None:
+            data = req.requestData(self.api_key, 2, war_id)
+        return data
+
+    def stop(self):
+        """Stops prefetching. Waits up to STOP_TIMEOUT seconds for the request in progress,
+        ex: one waiting out a rate limit backoff, then leaves it to end in the background"""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join(STOP_TIMEOUT)
+            if self.thread.is_alive():
+                self.stopped_threads.append(self.thread)
+            self.thread = None
+        self.page_war_id = None
+
+    def finish(self):
+        """Stops prefetching and waits for the requests left in the background by stop.
+        Call before a download reads the archive, pages stored while it reads them would be lost"""
+        self.stop()
+        if any(thread.is_alive() for thread in self.stopped_threads):
+            print("Waiting for background requests to finish..")
+        for thread in self.stopped_threads:
+            thread.join()
+        self.stopped_threads = []
+
+    def _run(self, report_war_ids, page_war_id):
+        self.page_war_id = page_war_id
+        self.stop_event = threading.Event()
+        # Reports prefetched, or being prefetched, by an earlier run are left out
+        report_war_ids = [
+            war_id
+            for war_id in report_war_ids
+            if war_id not in self.war_reports and war_id not in self.report_events
+        ]
+        for war_id in report_war_ids:
+            self.report_events[war_id] = threading.Event()
+        self.thread = threading.Thread(
+            target=self._prefetch,
+            args=(report_war_ids, page_war_id, self.stop_event),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def _prefetch(self, report_war_ids, page_war_id, stop_event):
+        # API errors exit, which only ends this thread. A request that is needed fails again in the foreground.
+        try:
+            for war_id in report_war_ids:
+                if stop_event.is_set():
+                    return
+                try:
+                    self.war_reports[war_id] = req.requestData(
+                        self.api_key, 2, war_id, quiet=True
+                    )
+                except SystemExit:
+                    pass
+                self.report_events[war_id].set()
+        finally:
+            # war_report requests the reports this run didn't get to
+            for war_id in report_war_ids:
+                self.report_events[war_id].set()
+        if page_war_id is not None:
+            try:
+                self._prefetch_pages(page_war_id, stop_event)
+            except SystemExit:
+                pass
+
+    def _prefetch_pages(self, war_id, stop_event):
+        """Downloads the first PREFETCH_PAGES pages of the attacks and revives of an ended war, unless it was saved before"""
+        if war_id in self.report_events:
+            self.report_events[war_id].wait()  # Can be requested by an earlier run
+        if war_id not in self.war_reports:
+            return
+        war_time_info = self.war_reports[war_id]["rankedwarreport"]["war"]
+        if not req.war_has_ended(war_time_info):
+            return
+        import wa_pipeline as pipe # Waits for waranalyzer's warm up to load it
+
+        if pipe.war_files_saved(war_id):
+            return  # Likely to be imported
+        for mode in req.MULTIPAGE_MODES:
+            if stop_event.is_set():
+                return
+            pages = req.iter_archive_download(
+                self.api_key, war_time_info, mode, self.scope, quiet=True
+            )
+            for page_number, _ in enumerate(pages, 1):
+                if stop_event.is_set():
+                    pages.close()
+                    return
+                if page_number == PREFETCH_PAGES:
+                    pages.close()
+                    break
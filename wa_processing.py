@@ -37,6 +37,24 @@ def extract_wars(data):
 
     return wars
 
+def extract_active_war(data, now):
+    """Finds the war that has started and not ended in the faction's ranked wars.
+    Returns (war_id, war_data) shaped like a ranked war report without rewards, or None"""
+    for war_id, war in data["rankedwars"].items():
+        war_time_info = war["war"]
+        if war_time_info["start"] <= now and (
+            war_time_info["end"] == 0 or war_time_info["end"] > now
+        ):
+            war_data = {
+                "war": war_time_info,
+                "factions": {
+                    faction_id: {"name": faction["name"], "score": faction["score"]}
+                    for faction_id, faction in war["factions"].items()
+                },
+            }
+            return war_id, war_data
+    return None
+
 # def extract_war_chains(news_data, war_time_info):
 #     """Searches main new for chains that occured during the war time frame, returns list of chain IDs"""
 #     war_start_time = int(war_time_info["start"])
@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+import json
+import platform
+from time import perf_counter, time
+import tracemalloc
+import wa_ratelimit as rl
+
+MB = 1024 * 1024
+
+_active = None
+
+
+class RunProfile:
+    """Records the wall time, peak memory, rows, API calls and rate limit sleep of each stage of a run.
+    A stage entered again under the same parent adds to its totals, so work done a page or chart at a time
+    ends up as one stage. Stages opened inside another stage record it as their parent.
+
+    trace_memory -- trace peak memory with tracemalloc, which slows Python heavy stages down
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = dict()  # (parent, name) -> record, in the order the stages were first entered
+        self.created = int(time())
+        self.started = perf_counter()
+        self._open = []  # (record, memory when it was entered) of the stages being recorded
+        self._started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def _update_peaks(self):
+        """Adds the peak since the last update to every open stage, then starts a new peak"""
+        peak = tracemalloc.get_traced_memory()[1]
+        for record, start_memory in self._open:
+            record["peak_mb"] = max(record["peak_mb"], round((peak - start_memory) / MB, 2))
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Records the code in the with block as a stage. Yields a dict whose "name" and "rows" can be set inside it,
+        ex: once a chart is created and has a title"""
+        measure = {"name": name, "rows": rows}
+        parent = self._open[-1][0]["stage"] if self._open else None
+        record = {"stage": name, "peak_mb": 0.0}
+        start_memory = 0
+        if self.trace_memory:
+            self._update_peaks()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        self._open.append((record, start_memory))
+        calls, slept = rl.usage()
+        started = perf_counter()
+        try:
+            yield measure
+        finally:
+            seconds = perf_counter() - started
+            if self.trace_memory:
+                self._update_peaks()
+            self._open.pop()
+            end_calls, end_slept = rl.usage()
+            self._add(
+                parent,
+                measure["name"],
+                seconds,
+                record["peak_mb"],
+                measure["rows"],
+                end_calls - calls,
+                end_slept - slept,
+            )
+
+    def _add(self, parent, name, seconds, peak_mb, rows, api_calls, rate_limit_sleep):
+        key = (parent, name)
+        if key not in self.stages:
+            self.stages[key] = {
+                "stage": name,
+                "parent": parent,
+                "count": 0,
+                "seconds": 0.0,
+                "peak_mb": None,
+                "rows": None,
+                "api_calls": 0,
+                "rate_limit_sleep": 0.0,
+            }
+        record = self.stages[key]
+        record["count"] += 1
+        record["seconds"] += seconds
+        if self.trace_memory:
+            record["peak_mb"] = max(record["peak_mb"] or 0.0, peak_mb)
+        if rows is not None:
+            record["rows"] = (record["rows"] or 0) + rows
+        record["api_calls"] += api_calls
+        record["rate_limit_sleep"] += rate_limit_sleep
+
+    def iter_stage(self, items, name, rows=len):
+        """Yields every item of an iterator, recording the time taken to produce each one as a stage.
+        name -- stage name, or a function of the item that returns it
+        rows -- function of the item that returns its row count, or None"""
+        items = iter(items)
+        while True:
+            with self.stage(name if isinstance(name, str) else "") as measure:
+                item = next(items, None)
+                if item is not None:
+                    if not isinstance(name, str):
+                        measure["name"] = name(item)
+                    if rows is not None:
+                        measure["rows"] = rows(item)
+            if item is None:
+                self._discard(measure["name"])
+                return
+            yield item
+
+    def _discard(self, name):
+        """Undoes the last entry of a stage, used for the call that found an iterator empty"""
+        parent = self._open[-1][0]["stage"] if self._open else None
+        record = self.stages[(parent, name)]
+        record["count"] -= 1
+        if record["count"] == 0:
+            del self.stages[(parent, name)]
+
+    def to_dict(self):
+        stages = []
+        for record in self.stages.values():
+            record = dict(record)
+            record["seconds"] = round(record["seconds"], 4)
+            record["rate_limit_sleep"] = round(record["rate_limit_sleep"], 2)
+            stages.append(record)
+        calls, slept = rl.usage()
+        total = {
+            # Includes the time spent waiting at prompts, stage_seconds doesn't
+            "seconds": round(perf_counter() - self.started, 4),
+            "stage_seconds": round(
+                sum(record["seconds"] for record in stages if record["parent"] is None), 4
+            ),
+            "api_calls": calls,
+            "rate_limit_sleep": round(slept, 2),
+        }
+        if self.trace_memory:
+            total["peak_mb"] = max(
+                [record["peak_mb"] for record in stages if record["parent"] is None],
+                default=0.0,
+            )
+        return {
+            "created": self.created,
+            "python": platform.python_version(),
+            "total": total,
+            "stages": stages,
+        }
+
+    def save(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def enable(trace_memory=True):
+    """Starts recording the stages of this run, returns the RunProfile"""
+    global _active
+    _active = RunProfile(trace_memory)
+    return _active
+
+
+def active():
+    """The RunProfile being recorded, or None when profiling is off"""
+    return _active
+
+
+@contextmanager
+def stage(name, rows=None):
+    """RunProfile.stage of the active profile. Does nothing but yield the dict when profiling is off."""
+    if _active is None:
+        yield {"name": name, "rows": rows}
+    else:
+        with _active.stage(name, rows) as measure:
+            yield measure
+
+
+def iter_stage(items, name, rows=len):
+    """RunProfile.iter_stage of the active profile, or items unchanged when profiling is off"""
+    if _active is None:
+        return items
+    return _active.iter_stage(items, name, rows)
+
+
+def disable():
+    """Turns profiling off without saving, stops tracing memory"""
+    global _active
+    if _active is not None:
+        _active.close()
+        _active = None
+
+
+def save(filename):
+    """Saves the active profile as JSON, then turns profiling off"""
+    _active.save(filename)
+    disable()
+    print("Saved run profile to " + filename + ".")
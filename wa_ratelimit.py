@@ -0,0 +1,93 @@
+from collections import deque
+import threading
+from time import monotonic, sleep
+
+# Torn allows 100 calls per minute per key owner, leave some room for other tools
+API_CALLS_PER_MINUTE = 90
+# Torn counts the calls of the last 60 seconds
+WINDOW_SECONDS = 60
+# Longest wait after repeated "Too many requests" errors
+MAX_BACKOFF = 120
+
+
+class RateLimiter:
+    """Keeps a key's API calls under its per-minute budget. Counts the calls made in the last
+    WINDOW_SECONDS like Torn does, so no 60 second window ever holds more than calls_per_minute calls.
+    Call acquire() before every request, penalize() when Torn returns error code 5
+    and reward() after a successful response."""
+
+    def __init__(self, calls_per_minute=API_CALLS_PER_MINUTE):
+        self.capacity = calls_per_minute
+        self.window = deque()  # Times of the calls in the last WINDOW_SECONDS, oldest first
+        self.blocked_until = 0.0  # Set by penalize
+        self.backoff = 0
+        self.time_slept = 0.0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _wait_time(self, now):
+        """Seconds until a call is allowed, 0 if one is allowed now"""
+        while self.window and now - self.window[0] >= WINDOW_SECONDS:
+            self.window.popleft()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if len(self.window) < self.capacity:
+            return 0
+        return self.window[0] + WINDOW_SECONDS - now
+
+    def available(self):
+        """Calls that can be made right now, negative while backing off"""
+        with self.lock:
+            now = monotonic()
+            self._wait_time(now)
+            if now < self.blocked_until:
+                return now - self.blocked_until
+            return self.capacity - len(self.window)
+
+    def acquire(self):
+        """Blocks until a call is allowed. Returns the number of seconds slept."""
+        slept = 0.0
+        while True:
+            with self.lock:
+                now = monotonic()
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    self.window.append(now)
+                    self.calls += 1
+                    self.time_slept += slept
+                    return slept
+            sleep(wait)
+            slept += wait
+
+    def penalize(self):
+        """Stop calling for a while, longer each time the API reports too many requests"""
+        with self.lock:
+            self.backoff = min(MAX_BACKOFF, max(5, self.backoff * 2))
+            self.blocked_until = monotonic() + self.backoff
+        print("API rate limit reached, waiting " + str(self.backoff) + " seconds..")
+
+    def reward(self):
+        with self.lock:
+            self.backoff = 0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_key):
+    """Returns the shared RateLimiter for an API key, creating it on first use"""
+    with _limiters_lock:
+        if api_key not in _limiters:
+            _limiters[api_key] = RateLimiter()
+        return _limiters[api_key]
+
+
+def usage():
+    """Returns (API calls, seconds slept) of every key's limiter so far"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return (
+        sum(limiter.calls for limiter in limiters),
+        sum(limiter.time_slept for limiter in limiters),
+    )
@@ -0,0 +1,190 @@
+import base64
+import datetime
+import os
+import numpy as np
+from pandas import to_datetime
+from plotly.io.json import to_json_plotly
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+PLOTLYJS_CDN_URL = "https://cdn.plot.ly/plotly-{version}.min.js"
+# First plotly.js version that decodes {"dtype", "bdata"} typed arrays
+TYPED_ARRAY_PLOTLYJS = (2, 28, 0)
+# Arrays shorter than this stay as JSON text, the typed array wrapper would not pay for itself
+MIN_TYPED_ARRAY_LENGTH = 16
+# Typed array dtypes plotly.js can decode, smallest first. There are no 64 bit integers
+INTEGER_DTYPES = ["i1", "u1", "i2", "u2", "i4", "u4"]
+
+
+def typed_array_supported():
+    version = tuple(int(part) for part in get_plotlyjs_version().split(".")[:3])
+    return version >= TYPED_ARRAY_PLOTLYJS
+
+
+def _is_datetime_array(values):
+    if np.issubdtype(values.dtype, np.datetime64):
+        return True
+    return values.dtype == object and isinstance(
+        values[0], (datetime.datetime, np.datetime64)
+    )
+
+
+def _typed_array(values):
+    """Encodes a 1d numeric or datetime array as a plotly.js typed array.
+    Datetimes become milliseconds since the epoch, which plotly.js reads as UTC dates on a date axis.
+
+    Returns (typed array dict, True if the values were datetimes), or (None, False) if values can't be encoded
+    """
+    values = np.asarray(values)
+    if values.ndim != 1 or values.shape[0] < MIN_TYPED_ARRAY_LENGTH:
+        return None, False
+
+    is_datetime = _is_datetime_array(values)
+    if is_datetime:
+        times = to_datetime(values)
+        if times.hasnans:
+            return None, False
+        # Whole milliseconds are exact as float64, and plotly.js has no 64 bit integer array
+        values = (times.asi8 // 1_000_000).astype("f8")
+    elif values.dtype.kind in "iu":
+        low, high = values.min(), values.max()
+        for dtype in INTEGER_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                values = values.astype(dtype)
+                break
+        else:
+            values = values.astype("f8")
+    elif values.dtype.kind == "f":
+        values = values.astype("f8")
+    else:
+        return None, False
+
+    dtype = values.dtype.str[1:]
+    data = values.astype("<" + dtype).tobytes()  # plotly.js reads little endian
+    return {"dtype": dtype, "bdata": base64.b64encode(data).decode("ascii")}, is_datetime
+
+
+def encode_figure(fig):
+    """Figure JSON with the numeric and datetime x/y arrays of every trace stored as base64 typed arrays.
+    Axes that held datetimes are set to type "date" so the epoch milliseconds still show as times."""
+    fig_dict = fig.to_plotly_json()
+    layout = fig_dict.setdefault("layout", {})
+    for trace in fig_dict.get("data", []):
+        for key in ("x", "y"):
+            if key not in trace or trace[key] is None:
+                continue
+            encoded, is_datetime = _typed_array(trace[key])
+            if encoded is None:
+                continue
+            trace[key] = encoded
+            if is_datetime:
+                axis = trace.get(key + "axis", key)
+                axis = key + "axis" + axis[1:]
+                layout.setdefault(axis, {}).setdefault("type", "date")
+    return to_json_plotly(fig_dict)
+
+
+class ReportWriter:
+    """Streams the html report to disk one section at a time, nothing is kept in memory.
+    plotly.js is included once in the head, as a CDN link or inline for offline viewing.
+    Each figure is written as compact JSON drawn by a short script.
+
+    include_plotlyjs -- "cdn" or "inline"
+    encoding -- "json" writes figure data as JSON text,
+        "binary" stores numeric and time arrays as base64 typed arrays, needs plotly.js 2.28 or newer
+    refresh_seconds -- makes the browser reload the report this often, for reports that are rewritten
+
+    The report is written to a temporary file that replaces filename on close,
+    so a browser never loads a half written report. If writing fails inside a with block the
+    temporary file is deleted and the previous report is kept.
+    """
+
+    def __init__(
+        self, filename, include_plotlyjs="cdn", encoding="json", refresh_seconds=None
+    ):
+        self.filename = filename
+        self.figure_count = 0
+        if encoding == "binary" and not typed_array_supported():
+            print(
+                "plotly.js "
+                + get_plotlyjs_version()
+                + " can't read binary figure data, writing it as JSON. Upgrade plotly to use it."
+            )
+            encoding = "json"
+        self.encoding = encoding
+        # Bytes of figure data written, and what the same figures take as JSON text
+        self.figure_bytes = 0
+        self.json_bytes = 0
+        self.file = open(filename + ".tmp", "w", encoding="utf-8")
+        self.file.write('<html><head><meta charset="utf-8">')
+        if refresh_seconds:
+            self.file.write(
+                '<meta http-equiv="refresh" content="' + str(int(refresh_seconds)) + '">'
+            )
+        if include_plotlyjs == "inline":
+            self.file.write('<script type="text/javascript">')
+            self.file.write(get_plotlyjs())
+            self.file.write("</script>")
+        else:
+            self.file.write(
+                '<script src="'
+                + PLOTLYJS_CDN_URL.format(version=get_plotlyjs_version())
+                + '" charset="utf-8"></script>'
+            )
+        self.file.write("</head><body>")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_header(self, war_data, summary_table):
+        """Adds the faction names, war start time and summary table"""
+        factions = list(war_data["factions"].keys())
+        self.file.write(
+            "<h1>"
+            + war_data["factions"][factions[0]]["name"]
+            + " vs "
+            + war_data["factions"][factions[1]]["name"]
+            + "</h1>"
+            + "<h2>"
+            + str(datetime.datetime.fromtimestamp(war_data["war"]["start"]))
+            + "</h2>"
+            + summary_table
+        )
+
+    def add_figure(self, fig):
+        div_id = "chart-" + str(self.figure_count)
+        self.figure_count += 1
+        fig_json = fig.to_json()
+        self.json_bytes += len(fig_json)
+        if self.encoding == "binary":
+            fig_json = encode_figure(fig)
+        self.figure_bytes += len(fig_json)
+        # "</" would end the script tag early if a name contains it
+        fig_json = fig_json.replace("</", "<\\/")
+        self.file.write(
+            '<div id="'
+            + div_id
+            + '"></div><script type="text/javascript">Plotly.newPlot("'
+            + div_id
+            + '", '
+            + fig_json
+            + ");</script><hr>"
+        )
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write("</body></html>")
+            self.file.close()
+            os.replace(self.filename + ".tmp", self.filename)
+
+    def discard(self):
+        """Deletes the unfinished report, the previous one stays in place"""
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.filename + ".tmp")
@@ -1,9 +1,23 @@
+from contextlib import closing
 import json
+import os
+import queue
 import sys
-import requests
-from time import sleep
+import threading
+from time import time
+import wa_archive as arc
+import wa_cache as cache
+import wa_http as http
+import wa_keypool as kp
+import wa_ratelimit as rl
 
-API_BASE_URL = "https://api.torn.com/"
+try:
+    import orjson as json_decoder # Optional, decodes large attack pages several times faster
+except ImportError:
+    json_decoder = json
+
+# Set TORN_API_BASE_URL to send requests elsewhere, ex: the local stand-in in wa_fakeapi
+API_BASE_URL = os.environ.get("TORN_API_BASE_URL", "https://api.torn.com/")
 FACTION_BASIC_URL = "faction/?selections=basic&key="
 FACTION_NEWS_URL = "faction/?selections=mainnews&key="
 # Ranked War Report URL needs the War ID inserted between the pair
@@ -11,10 +25,80 @@
 FACTION_ATTACKS_URL = ["faction/?selections=attacks&from=", "&to=", "&key="]
 # CHAIN_REPORT_URL = ["torn/", "?selections=chainreport&key="]
 FACTION_REVIVES_URL = ["faction/?selections=revives&from=", "&to=", "&key="]
+FACTION_RANKED_WARS_URL = "faction/?selections=rankedwars&key="
+# (descriptor, url, timestamp field) of each request_multipage_data mode
+MULTIPAGE_MODES = {
+    0: ("attacks", FACTION_ATTACKS_URL, "timestamp_started"),
+    1: ("revives", FACTION_REVIVES_URL, "timestamp"),
+}
+# Torn returns at most this many rows per attacks/revives request
+API_PAGE_SIZE = 100
+# Seconds before a cached response is requested again, see wa_cache
+FACTION_BASIC_TTL = 3600
+FACTION_NEWS_TTL = 600
+FACTION_RANKED_WARS_TTL = 60
+# Torn API error code for "Too many requests"
+ERROR_TOO_MANY_REQUESTS = 5
+# Time slices per key a download is split into when several keys download it at once,
+# and the shortest slice
+SLICES_PER_KEY = 4
+MIN_SLICE_SECONDS = 600
+
+
+def _get_with_key(url, key):
+    """Waits for the key's rate limiter, then requests url + key.
+    Returns the parsed JSON data, which can be an API error"""
+    rl.get_limiter(key).acquire()
+    response = http.get(url + key) # Pooled session with timeouts and retries
+    return json_decoder.loads(response.content)
+
+
+def rate_limited_get(url, api_key):
+    """Waits for the key's rate limiter, then requests url + api_key.
+    api_key can be a wa_keypool.KeyPool, then the request uses the key with the most calls left.
+    Backs off and retries when Torn reports too many requests. A pool key that stops working is disabled
+    and the request is retried with another one, exits on any other API error or when no key is left.
+    Returns the parsed JSON data."""
+
+    pool = kp.as_pool(api_key)
+    while True:
+        key = pool.choose()
+        if key is None:
+            print("Every API key was disabled. Exiting..")
+            sys.exit()
+        data = _get_with_key(url, key)
+        limiter = rl.get_limiter(key)
+        if "error" in data.keys():
+            code = data["error"]["code"]
+            if code == ERROR_TOO_MANY_REQUESTS:
+                limiter.penalize()
+                continue
+            if code in kp.KEY_ERROR_CODES and pool.disable(key, data["error"]["error"]):
+                continue
+            print("Error:")
+            print(data)
+            sys.exit()
+        limiter.reward()
+        return data
+
 
+def next_time_marker(rows, timestamp_mode):
+    """Returns the latest timestamp on a page, the next request starts from it"""
+    return max(row[timestamp_mode] for row in rows.values())
 
-def requestData(api_key, mode, war_id=0, chain_id=0, war_time_info=None):
+
+def _progress(message, quiet, end="\n"):
+    """Prints a progress message unless quiet. Requests made in the background are quiet, so they don't interrupt prompts."""
+    if not quiet:
+        print(message, end=end)
+
+
+def requestData(
+    api_key, mode, war_id=0, chain_id=0, war_time_info=None, use_cache=True, quiet=False
+):
     """Performs requests to the Torn API. Requires an api_key and mode. Returns python object containing JSON data.
+    Modes 0-2 are answered from the local response cache while the entry is fresh, unless use_cache is False.
+    quiet -- don't print progress messages, errors are still printed
 
     modes:
     0 -- Basic Faction Info
@@ -23,31 +107,39 @@ def requestData(api_key, mode, war_id=0, chain_id=0, war_time_info=None):
     3 -- Faction Attacks(uses war_time_info argument)
     4 --  DO NOT USE -- Chain Report(uses chain_id argument)
     5 -- Faction Revives(uses war_time_info argument)
+    6 -- Faction Ranked Wars, includes the current war
     """
 
     data = None
+    url = None
+    cache_key = None
+    ttl = cache.NO_EXPIRY
+    key_scoped = False # Faction selections depend on which faction the key belongs to
 
     if mode == 0:
-        print("Requesting Faction Information..")
-        response = requests.get(API_BASE_URL + FACTION_BASIC_URL + api_key)
+        _progress("Requesting Faction Information..", quiet)
+        url = API_BASE_URL + FACTION_BASIC_URL
+        key_scoped = True
+        ttl = FACTION_BASIC_TTL
 
     elif mode == 1:
-        print("Requesting Main News to find recent Ranked Wars..")
-        response = requests.get(API_BASE_URL + FACTION_NEWS_URL + api_key)
+        _progress("Requesting Main News to find recent Ranked Wars..", quiet)
+        url = API_BASE_URL + FACTION_NEWS_URL
+        key_scoped = True
+        ttl = FACTION_NEWS_TTL
 
     elif mode == 2:
-        print("Requesting info for Ranked War ID " + str(war_id) + "..")
-        response = requests.get(
+        _progress("Requesting info for Ranked War ID " + str(war_id) + "..", quiet)
+        url = (
             API_BASE_URL
             + RANKED_WAR_REPORT_URL[0]
             + str(war_id)
             + RANKED_WAR_REPORT_URL[1]
-            + api_key
         )
+        cache_key = cache.make_cache_key(url)
 
     elif mode == 3:
-        print("Requesting Faction Attacks Log from war period..")
-        print("This may take some time, due to API limitations.")
+        _progress("Requesting Faction Attacks Log from war period..", quiet)
         data = request_multipage_data(api_key, war_time_info, 0)
         return data
 
@@ -62,99 +154,287 @@ def requestData(api_key, mode, war_id=0, chain_id=0, war_time_info=None):
         #     + api_key
         # )
     elif mode == 5:
-        print("Requesting Faction Revives Log from war period..")
-        print("This may take some time, due to API limitations.")
+        _progress("Requesting Faction Revives Log from war period..", quiet)
         data = request_multipage_data(api_key, war_time_info, 1)
         return data
 
-    data = json.loads(response.content)
+    elif mode == 6:
+        _progress("Requesting Faction Ranked Wars..", quiet)
+        url = API_BASE_URL + FACTION_RANKED_WARS_URL
+        key_scoped = True
+        ttl = FACTION_RANKED_WARS_TTL
 
-    if "error" in data.keys():
-        print("Error:")
-        print(data)
-        sys.exit()
-    else:
+    if url is None:
         return data
 
+    if key_scoped:
+        cache_key = cache.make_cache_key(url, _key_scope(api_key))
+    if use_cache:
+        data = cache.get(cache_key, ttl)
+        if data is not None:
+            _progress("Loaded from local cache.", quiet)
+            return data
+
+    data = rate_limited_get(url, api_key)
+    if key_scoped: # The request can disable the key the cache was scoped by
+        cache_key = cache.make_cache_key(url, _key_scope(api_key))
+    # Reports only stop changing once the war is over
+    if mode != 2 or war_has_ended(data["rankedwarreport"]["war"]):
+        cache.put(cache_key, data)
+    return data
+
+
+def _key_scope(api_key):
+    """Cache scope of api_key or a wa_keypool.KeyPool. The keys of a pool belong to one faction,
+    its scope is the first key that still works, a disabled key can belong to another faction"""
+    pool = kp.as_pool(api_key)
+    keys = pool.healthy_keys() or pool.keys
+    return cache.key_scope(keys[0])
+
+
+def war_has_ended(war_time_info):
+    return 0 < war_time_info["end"] <= time()
+
+
+def iter_new_rows(api_key, mode, time_marker, end, known_keys):
+    """Requests pages of attacks or revives from time_marker to end, moving the cursor to the latest timestamp of each page.
+    Stops after an empty or partial page, or when a page has no rows that aren't in known_keys and the cursor can't move forward.
+    The keys of new rows are added to known_keys, which can be a set or the dict of rows downloaded so far.
+
+    Yields (new_rows, time_marker) for every page with new rows, time_marker is where the next request starts
+    Modes:
+    0 -- attacks
+    1 -- revives
+    """
+    mode_descriptor, mode_url, timestamp_mode = MULTIPAGE_MODES[mode]
+    while time_marker < end:
+        data = rate_limited_get(
+            API_BASE_URL
+            + mode_url[0]
+            + str(time_marker)
+            + mode_url[1]
+            + str(end)
+            + mode_url[2],
+            api_key,
+        ) # Make request to the API, waits for the rate limiter
+        rows = data[mode_descriptor]
+        if len(rows) == 0: # Nothing left in the time range
+            break
+        # Pages overlap on the cursor timestamp, skip rows we already have
+        new_rows = {key: row for key, row in rows.items() if key not in known_keys}
+        next_marker = next_time_marker(rows, timestamp_mode)
+        if not new_rows:
+            # The cursor can't move forward or this was the last page, nothing left to fetch
+            if next_marker <= time_marker or len(rows) < API_PAGE_SIZE:
+                break
+            # A full page of known rows, ex: a poll that starts before its last marker
+            time_marker = next_marker
+            continue
+        known_keys.update(new_rows)
+        time_marker = next_marker
+        yield new_rows, time_marker
+        if len(rows) < API_PAGE_SIZE: # A partial page is the last page
+            break
+
+
+def _split_range(start, end, parts):
+    """Splits start to end, inclusive, into up to parts consecutive ranges of at least MIN_SLICE_SECONDS"""
+    parts = max(1, min(parts, (end - start + 1) // MIN_SLICE_SECONDS))
+    bounds = [start + (end - start + 1) * part // parts for part in range(parts + 1)]
+    return [(bounds[part], bounds[part + 1] - 1) for part in range(parts)]
+
+
+def _iter_parallel(ranges, iter_range, workers):
+    """Runs iter_range(start, end) for every time range in worker threads, a worker takes the next range when its range is done.
+    Yields the items of every range as they arrive, in no particular order.
+    An error in any thread is raised here, after the other threads stop."""
+    todo = queue.Queue()
+    for time_range in ranges:
+        todo.put(time_range)
+    items = queue.Queue()
+    stop_event = threading.Event()
+
+    def run():
+        try:
+            while not stop_event.is_set():
+                try:
+                    start, end = todo.get_nowait()
+                except queue.Empty:
+                    break
+                for item in iter_range(start, end):
+                    items.put(item)
+                    if stop_event.is_set():
+                        break
+        except BaseException as error: # API errors exit, which would only end this thread
+            items.put(error)
+        finally:
+            items.put(None)
+
+    threads = [threading.Thread(target=run, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            item = items.get()
+            if item is None:
+                running -= 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        # Threads finish the page they are requesting
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+
+def _iter_pages(api_key, ranges, iter_range):
+    """Pages of a cursor follow each other, so with a wa_keypool.KeyPool of several keys the time ranges are split
+    in slices that download at once, a worker thread per key. Events are rarely spread evenly over a war,
+    so there are SLICES_PER_KEY slices per key, workers done with a quiet slice take the next one.
+    With one key the ranges download one after the other."""
+    key_count = len(kp.as_pool(api_key).healthy_keys())
+    if key_count > 1:
+        slices = [
+            time_slice
+            for start, end in ranges
+            for time_slice in _split_range(start, end, key_count * SLICES_PER_KEY)
+        ]
+        return _iter_parallel(slices, iter_range, min(key_count, len(slices)))
+    return (item for start, end in ranges for item in iter_range(start, end))
+
 
 def request_multipage_data(api_key, war_time_info, mode):
     """Torn's API limits the number of rows in the response.
     Performs multiple requests, looping the timestamp, then returns a single object.
     Requires api_key, war_time_info, mode arguments.
+    Every row is requested, the archive isn't used, see iter_archive_download.
 
     Modes:
     0 -- attacks
     1 -- revives
     """
+    mode_descriptor = MULTIPAGE_MODES[mode][0]
+    rows = dict()
 
-    multipage_data = dict()
-    first_run = True
-    time_marker = war_time_info["start"]
-    download_counter = 0
-    mode_url = []
-    mode_descriptor = None
-    timestamp_mode = None
-    if mode == 0:
-        mode_url.append(FACTION_ATTACKS_URL[0])
-        mode_url.append(FACTION_ATTACKS_URL[1])
-        mode_url.append(FACTION_ATTACKS_URL[2])
-        mode_descriptor = "attacks"
-        timestamp_mode = "timestamp_started"
-    if mode == 1:
-        mode_url.append(FACTION_REVIVES_URL[0])
-        mode_url.append(FACTION_REVIVES_URL[1])
-        mode_url.append(FACTION_REVIVES_URL[2])
-        mode_descriptor = "revives"
-        timestamp_mode = "timestamp"
-
-    print(
-        "Downloaded " + str(download_counter) + " " + mode_descriptor + "..", end="\r"
+    def iter_range(start, end):
+        # Rows at a slice boundary are in one slice only, so each slice only skips its own
+        for new_rows, _ in iter_new_rows(api_key, mode, start, end, set()):
+            yield new_rows
+
+    pages = _iter_pages(api_key, [(war_time_info["start"], war_time_info["end"])], iter_range)
+    with closing(pages):
+        for new_rows in pages:
+            rows.update(new_rows)
+            print("Downloaded " + str(len(rows)) + " " + mode_descriptor + "..", end="\r")
+    print("Finished. Downloaded " + str(len(rows)) + " " + mode_descriptor + "!")
+    return {mode_descriptor: rows}
+
+
+def _download_range(api_key, mode, scope, start, end):
+    """Downloads the events of a log from start to end into the archive, with a connection of its own.
+    Each page is stored with the time range it completes before it is yielded,
+    so an interrupted download resumes from the range that is left. Yields the new rows of each page"""
+    mode_descriptor = MULTIPAGE_MODES[mode][0]
+    with closing(arc.connect()) as conn:
+        # An interrupted download stored some events at the timestamp it stopped at
+        known_keys = arc.stored_keys(conn, mode_descriptor, scope, start, end)
+        for new_rows, time_marker in iter_new_rows(api_key, mode, start, end, known_keys):
+            arc.store_rows(conn, mode_descriptor, scope, new_rows)
+            # Rows at the cursor timestamp can continue on the next page
+            arc.add_coverage(conn, mode_descriptor, scope, start, time_marker - 1)
+            conn.commit()
+            yield new_rows
+        arc.add_coverage(conn, mode_descriptor, scope, start, end)
+        conn.commit()
+
+
+def iter_archive_download(api_key, war_time_info, mode, scope, quiet=False):
+    """Downloads the attacks or revives of a war period that aren't in the local archive yet, see wa_archive.
+    Only the time ranges the archive doesn't cover are requested, so events shared with wars downloaded before,
+    ex: non-war hits between back to back wars, are not requested again.
+    Pages are stored as they arrive, so an interrupted download resumes from the range that is left.
+    Pages of one range follow each other, so with a wa_keypool.KeyPool of several keys
+    the ranges are split in time slices that download at once, one per key.
+
+    Yields the new rows of each page, the rows archived before are read with wa_archive.iter_frames
+    scope -- faction the log belongs to, ex: basic_faction_info["ID"]
+    quiet -- don't print progress messages
+    """
+    mode_descriptor = MULTIPAGE_MODES[mode][0]
+    start = war_time_info["start"]
+    end = war_time_info["end"]
+    with closing(arc.connect()) as conn:
+        archived = arc.count_rows(conn, mode_descriptor, scope, start, end)
+        gaps = arc.find_gaps(conn, mode_descriptor, scope, start, end)
+        if not gaps:
+            _progress(
+                "Loaded " + str(archived) + " " + mode_descriptor + " from " + arc.ARCHIVE_FILE + "..",
+                quiet,
+            )
+            return
+        if archived:
+            _progress(
+                "Found " + str(archived) + " " + mode_descriptor + " in " + arc.ARCHIVE_FILE
+                + ", downloading the rest..",
+                quiet,
+            )
+
+    pages = _iter_pages(
+        api_key,
+        gaps,
+        lambda start, end: _download_range(api_key, mode, scope, start, end),
     )
-    while time_marker < war_time_info["end"]:
-        response = requests.get(
-            API_BASE_URL
-            + mode_url[0]
-            + str(time_marker)
-            + mode_url[1]
-            + str(war_time_info["end"])
-            + mode_url[2]
-            + api_key
-        ) # Make request to the API
-        # print(response.url)
-        data = json.loads(response.content)
-        event_counter = 0
-        if len(data[mode_descriptor]) > 0: # Check that the API returned attacks
-            if first_run: # First run downloads all rows without extra checks
-                multipage_data = data
-                event_counter = len(multipage_data[mode_descriptor]) - 1
-                first_run = False
-            else:
-                for key in iter(data[mode_descriptor]): # Iterate through attack keys and check our data for them to prevent duplicates
-                    if key not in multipage_data[mode_descriptor]:
-                        multipage_data[mode_descriptor].update({key:data[mode_descriptor][key]})
-                        event_counter += 1
-            if mode == 0:
-                timestamp_split = response.text.split('"' + timestamp_mode + '":') # Get the last row on the page and set the new time marker to the timestamp
-                time_marker = int(timestamp_split[len(timestamp_split) - 1].split(",")[0])
-            elif mode == 1:
-                timestamp_split = response.text.split(":{\"timestamp\":") # Get the last row on the page and set the new time marker to the timestamp
-                time_marker = int(timestamp_split[len(timestamp_split) - 1].split(",")[0])
-
-        else:
-            time_marker = 4070912400
-        if event_counter == 0 and (abs(time_marker - war_time_info["end"]) <= 300): # If no updates are made, check if last timestamp is within 5 minutes of the end of war
-            time_marker = 4070912400
-            break
-        download_counter += event_counter
+    downloaded = 0
+    try:
+        with closing(pages):
+            for new_rows in pages:
+                downloaded += len(new_rows)
+                _progress(
+                    "Downloaded " + str(downloaded) + " " + mode_descriptor + "..",
+                    quiet,
+                    end="\r",
+                )
+                yield new_rows
+    except KeyboardInterrupt:
         print(
-            "Downloaded " + str(download_counter) + " " + mode_descriptor + "..",
-            end="\r",
+            "\nDownload interrupted. Progress is saved in " + arc.ARCHIVE_FILE + ", run again to resume."
         )
-        sleep(30)  # Sleep to prevent API from sending the same result back
-    print("Finished. Downloaded " + str(download_counter + 1) + " " + mode_descriptor + "!")
-    
-    # with open(
-    #     "war-preprocessed-" + mode_descriptor + "-" + str(war_time_info["start"]) + ".json", "w"
-    # ) as save_file:
-    #     save_file.write(json.dumps(multipage_data))
-    return multipage_data
+        sys.exit()
+
+    _progress("Finished. Downloaded " + str(downloaded) + " " + mode_descriptor + "!", quiet)
+
+
+def _key_error(url, key):
+    """Requests url with key alone, waiting out too many requests errors.
+    Returns (data, error message), the message is None if the request worked"""
+    limiter = rl.get_limiter(key)
+    while True:
+        data = _get_with_key(url, key)
+        if "error" not in data.keys():
+            limiter.reward()
+            return data, None
+        if data["error"]["code"] != ERROR_TOO_MANY_REQUESTS:
+            return data, data["error"]["error"]
+        limiter.penalize()
+
+
+def check_key_factions(pool, faction_id):
+    """Disables the keys of a pool that can't download faction_id's logs: keys of another faction,
+    whose attacks and revives would be mixed into the faction's, and keys without faction API access"""
+    now = str(int(time()))
+    for key in pool.healthy_keys()[1:]:
+        data, error = _key_error(API_BASE_URL + FACTION_BASIC_URL, key)
+        if error is None and str(data["ID"]) != str(faction_id):
+            error = "belongs to faction " + str(data["ID"])
+        if error is None:
+            # Basic info needs no faction API access, the attacks of the last second do
+            _, error = _key_error(
+                API_BASE_URL + FACTION_ATTACKS_URL[0] + now + FACTION_ATTACKS_URL[1] + now
+                + FACTION_ATTACKS_URL[2],
+                key,
+            )
+        if error is not None:
+            pool.disable(key, error)
@@ -0,0 +1,285 @@
+import argparse
+import os
+import random
+import wa_aggregates as agg
+
+WAR_ID = 99999
+START = 1650000000
+OUR_FACTION = (1111, "Synthetic Alpha")
+ENEMY_FACTION = (2222, "Synthetic Bravo")
+# Factions hit outside the war, their attacks on us are non-war hits too
+OUTSIDE_FACTIONS = [(3333, "Synthetic Charlie"), (4444, "Synthetic Delta")]
+PLAYERS_PER_FACTION = 100
+# Average seconds between attacks, the war lasts as long as the attacks need
+SECONDS_PER_ATTACK = 3
+# Share of attacks of each kind
+STEALTH_RATE = 0.05
+ASSIST_RATE = 0.10
+FAILED_RATE = 0.08
+RETALIATION_RATE = 0.06
+NON_WAR_RATE = 0.10
+# Share of war attacks made by our faction, the enemy makes the rest
+OUR_SHARE = 0.55
+REVIVE_SUCCESS_RATE = 0.7
+# Seconds without a hit before a faction's chain breaks
+CHAIN_TIMEOUT = 300
+# Respect of the hit that reaches each chain bonus count
+CHAIN_BONUS_RESPECT = dict(
+    zip(agg.CHAIN_BONUS_HITS, [10 * 2**step for step in range(len(agg.CHAIN_BONUS_HITS))])
+)
+
+
+def players(faction, count=PLAYERS_PER_FACTION):
+    faction_id, faction_name = faction
+    return [
+        (faction_id * 1000 + number, faction_name.split()[-1] + "_" + str(number))
+        for number in range(count)
+    ]
+
+
+def war_end(attack_count):
+    """End of a war of attack_count attacks, every generated attack starts by then"""
+    return START + attack_count * SECONDS_PER_ATTACK
+
+
+def war_report(attack_count):
+    """Ranked war report like torn/<id>?selections=rankedwarreport, the war lasts long enough for attack_count"""
+    end = war_end(attack_count)
+    return {
+        "rankedwarreport": {
+            "war": {"start": START, "end": end, "winner": OUR_FACTION[0], "forfeit": False},
+            "factions": {
+                str(OUR_FACTION[0]): {
+                    "name": OUR_FACTION[1],
+                    "score": 0,
+                    "attacks": 0,
+                    "rewards": {"respect": 1500, "points": 0, "items": []},
+                },
+                str(ENEMY_FACTION[0]): {
+                    "name": ENEMY_FACTION[1],
+                    "score": 0,
+                    "attacks": 0,
+                    "rewards": {"respect": 500, "points": 0, "items": []},
+                },
+            },
+        }
+    }
+
+
+def faction_basic():
+    """Faction info like faction/?selections=basic for our faction"""
+    return {
+        "ID": OUR_FACTION[0],
+        "name": OUR_FACTION[1],
+        "tag": "SYN",
+        "rank": {"name": "Gold", "division": 2},
+    }
+
+
+def main_news(war_id=WAR_ID, attack_count=0):
+    """Main news with the article wa_processing.extract_wars looks for"""
+    profile = "<a href=http://www.torn.com/factions.php?step=profile&ID="
+    news = (
+        profile + str(OUR_FACTION[0]) + ">" + OUR_FACTION[1] + "</a> defeated "
+        + profile + str(ENEMY_FACTION[0]) + ">" + ENEMY_FACTION[1] + "</a> in a ranked war "
+        + "<a href=http://www.torn.com/page.php?sid=factionWarfare#/ranked/rankID="
+        + str(war_id) + ">View</a>"
+    )
+    timestamp = war_end(attack_count)
+    return {"mainnews": {"1": {"news": news, "timestamp": timestamp}}}
+
+
+def ranked_wars(war_id=WAR_ID, attack_count=0):
+    """Ranked wars like faction/?selections=rankedwars"""
+    war = war_report(attack_count)["rankedwarreport"]
+    return {
+        "rankedwars": {
+            str(war_id): {
+                "war": war["war"],
+                "factions": {
+                    faction_id: {"name": faction["name"], "score": 0, "chain": 0}
+                    for faction_id, faction in war["factions"].items()
+                },
+            }
+        }
+    }
+
+
+def _respect(rnd, modifiers):
+    base = rnd.uniform(1.5, 4.5)
+    return round(
+        base * modifiers["fair_fight"] * modifiers["war"] * modifiers["retaliation"]
+        * modifiers["group_attack"] * modifiers["overseas"] * modifiers["chain_bonus"],
+        2,
+    )
+
+
+def attacks(count, seed=0):
+    """Attack log like faction/?selections=attacks, with count rows covering the war.
+    Has stealth hits, assists, failed attacks, retaliations, chain bonus hits and non-war hits."""
+    rnd = random.Random(seed)
+    factions = [OUR_FACTION, ENEMY_FACTION] + OUTSIDE_FACTIONS
+    roster = {faction: players(faction) for faction in factions}
+    chains = {OUR_FACTION: [0, START], ENEMY_FACTION: [0, START]}
+    rows = dict()
+    timestamp = START
+    end = war_end(count)
+
+    for number in range(count):
+        # Steps average SECONDS_PER_ATTACK, the last attacks are held at the end so the war period has all of them
+        timestamp = min(end, timestamp + rnd.randint(0, 2 * SECONDS_PER_ATTACK))
+        if rnd.random() < NON_WAR_RATE:
+            # Our faction hitting outsiders, or outsiders hitting us
+            outsider = rnd.choice(OUTSIDE_FACTIONS)
+            attacker_faction, defender_faction = (
+                (OUR_FACTION, outsider) if rnd.random() < 0.6 else (outsider, OUR_FACTION)
+            )
+            ranked_war = 0
+        else:
+            attacker_faction, defender_faction = (
+                (OUR_FACTION, ENEMY_FACTION)
+                if rnd.random() < OUR_SHARE
+                else (ENEMY_FACTION, OUR_FACTION)
+            )
+            ranked_war = 1
+        attacker = rnd.choice(roster[attacker_faction])
+        defender = rnd.choice(roster[defender_faction])
+
+        roll = rnd.random()
+        if roll < ASSIST_RATE:
+            result = "Assist"
+        elif roll < ASSIST_RATE + FAILED_RATE:
+            result = rnd.choice(agg.FAILED_RESULTS)
+        else:
+            result = rnd.choice(["Attacked", "Hospitalized", "Hospitalized", "Mugged"])
+        success = result in agg.HIT_RESULTS
+
+        chain = 0
+        if attacker_faction in chains and success:
+            chain_state = chains[attacker_faction]
+            if timestamp - chain_state[1] > CHAIN_TIMEOUT:
+                chain_state[0] = 0
+            chain_state[0] += 1
+            chain_state[1] = timestamp
+            chain = chain_state[0]
+
+        modifiers = {
+            "fair_fight": round(rnd.uniform(1.0, 3.0), 2),
+            "war": 2 if ranked_war else 1,
+            "retaliation": agg.RETALIATION_MODIFIER if rnd.random() < RETALIATION_RATE else 1,
+            "group_attack": 1,
+            "overseas": 1.25 if rnd.random() < 0.02 else 1,
+            "chain_bonus": 1,
+        }
+        respect = 0
+        if success:
+            respect = _respect(rnd, modifiers)
+            if chain in CHAIN_BONUS_RESPECT:
+                modifiers["chain_bonus"] = round(CHAIN_BONUS_RESPECT[chain] / respect, 2)
+                respect = CHAIN_BONUS_RESPECT[chain]
+
+        stealthed = ranked_war == 1 and success and rnd.random() < STEALTH_RATE
+        duration = rnd.randint(3, 60)
+        rows[str(100000000 + number)] = {
+            "code": "%032x" % rnd.getrandbits(128),
+            "timestamp_started": timestamp,
+            "timestamp_ended": timestamp + duration,
+            "attacker_id": "" if stealthed else attacker[0],
+            "attacker_name": "N/A" if stealthed else attacker[1],
+            "attacker_faction": "" if stealthed else attacker_faction[0],
+            "attacker_factionname": "N/A" if stealthed else attacker_faction[1],
+            "defender_id": defender[0],
+            "defender_name": defender[1],
+            "defender_faction": defender_faction[0],
+            "defender_factionname": defender_faction[1],
+            "result": result,
+            "stealthed": int(stealthed),
+            "respect": respect,
+            "chain": chain,
+            "raid": 0,
+            "ranked_war": ranked_war,
+            "respect_gain": respect,
+            "respect_loss": respect,
+            "modifiers": modifiers,
+        }
+    return {"attacks": rows}
+
+
+def revives(count, attack_count=None, seed=0):
+    """Revive log like faction/?selections=revives, with count rows spread over the war of attack_count attacks.
+    Players of both warring factions are revived by our faction."""
+    rnd = random.Random(seed)
+    if attack_count is None:
+        attack_count = count * 4
+    duration = max(1, war_end(attack_count) - START)
+    ours = players(OUR_FACTION)
+    theirs = players(ENEMY_FACTION)
+    rows = dict()
+    timestamps = sorted(rnd.randint(START, START + duration) for _ in range(count))
+    for number, timestamp in enumerate(timestamps):
+        target_faction, target = (
+            (OUR_FACTION, rnd.choice(ours))
+            if rnd.random() < 0.85
+            else (ENEMY_FACTION, rnd.choice(theirs))
+        )
+        reviver = rnd.choice(ours)
+        chance = round(rnd.uniform(40, 100), 2)
+        rows[str(200000000 + number)] = {
+            "timestamp": timestamp,
+            "result": "success" if rnd.random() < REVIVE_SUCCESS_RATE else "failure",
+            "chance": chance,
+            "reviver_id": reviver[0],
+            "reviver_name": reviver[1],
+            "reviver_faction": OUR_FACTION[0],
+            "reviver_factionname": OUR_FACTION[1],
+            "target_id": target[0],
+            "target_name": target[1],
+            "target_faction": target_faction[0],
+            "target_factionname": target_faction[1],
+            "target_hospital_reason": "Hospitalized by " + rnd.choice(theirs)[1],
+            "target_early_discharge": int(rnd.random() < 0.05),
+            "target_last_action": {
+                "status": rnd.choice(["Online", "Idle", "Offline"]),
+                "timestamp": timestamp - rnd.randint(0, 3600),
+            },
+        }
+    return {"revives": rows}
+
+
+def write_fixtures(folder, attack_count, revive_count=None, seed=0, war_id=WAR_ID):
+    """Writes a synthetic war as fixtures for wa_fakeapi"""
+    import wa_fakeapi as fake
+
+    if revive_count is None:
+        revive_count = attack_count // 4
+    os.makedirs(folder, exist_ok=True)
+    fake.save_fixture(folder, "basic", faction_basic())
+    fake.save_fixture(folder, "mainnews", main_news(war_id, attack_count))
+    fake.save_fixture(folder, "rankedwars", ranked_wars(war_id, attack_count))
+    fake.save_fixture(folder, "rankedwarreport-" + str(war_id), war_report(attack_count))
+    fake.save_fixture(folder, "attacks", attacks(attack_count, seed))
+    fake.save_fixture(folder, "revives", revives(revive_count, attack_count, seed))
+    print(
+        "Saved a synthetic war with "
+        + str(attack_count)
+        + " attacks and "
+        + str(revive_count)
+        + " revives in "
+        + folder
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic ranked war as fixtures for wa_fakeapi"
+    )
+    parser.add_argument("folder")
+    parser.add_argument("--attacks", type=int, default=10000)
+    parser.add_argument("--revives", type=int, default=None, help="default attacks / 4")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_fixtures(args.folder, args.attacks, args.revives, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,116 @@
+import argparse
+import sys
+import threading
+from time import time
 import wa_io as io
 import wa_requests as req
 import wa_processing as proc
-import wa_data_handler as dh
+import wa_prefetch as pre
+import wa_profile as prof
+
+# The analysis modules load pandas, numpy and plotly, which takes seconds.
+# They are imported by warm_up while the prompts wait on the user.
+
+
+def warm_up():
+    """Imports the analysis modules and the libraries they load, and creates the API session"""
+    import wa_batch
+    import wa_http
+    import wa_live
+    import wa_pipeline
+
+    io.load_feather()
+    wa_http.get_session()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Torn Ranked War Analyzer")
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        const=0,
+        type=float,
+        metavar="MINUTES",
+        help="watch the faction's running war, updating its html report every MINUTES "
+        + "(default WATCH_INTERVAL_MINUTES in wa_live.py)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record the time, peak memory, rows and API calls of each stage of a single war analysis, "
+        + "saved as war-<WarID>-profile-<time>.json next to the report",
+    )
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
+    if args.profile:
+        prof.enable()
+    warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+    warm_up_thread.start()
     io.intro()
     api_key = io.api_key_input()
     #api_key = ""  # DEBUG
 
-    faction_data = req.requestData(api_key, 0)
+    with prof.stage("request faction info"):
+        faction_data = req.requestData(api_key, 0)
     basic_faction_info = proc.extract_faction_info(faction_data)
-    news_data = req.requestData(api_key, 1)
+    if len(api_key.keys) > 1:
+        with prof.stage("check keys"):
+            req.check_key_factions(api_key, basic_faction_info["ID"])
+
+    if args.watch is not None:
+        warm_up_thread.join()
+        import wa_live as live
+
+        active_war = live.find_active_war(api_key)
+        if active_war is None:
+            print("The faction is not in a running ranked war. Exiting..")
+            sys.exit()
+        war_id, war_data = active_war
+        if args.profile:
+            print("Profiling only covers single war analysis, watching without it..")
+            prof.disable()
+        live.watch_war(
+            api_key,
+            war_id,
+            war_data,
+            basic_faction_info,
+            args.watch or live.WATCH_INTERVAL_MINUTES,
+        )
+        return
+
+    with prof.stage("request news"):
+        news_data = req.requestData(api_key, 1)
 
     war_list = proc.extract_wars(news_data)
     war_list_formatted = proc.format_war_list(war_list, basic_faction_info)
-    war_id = io.war_selection_table(basic_faction_info, war_list_formatted)
+    # Requests the likely next reports and pages while the prompts wait
+    prefetcher = pre.Prefetcher(api_key, basic_faction_info["ID"])
+    prefetcher.start([war[1] for war in war_list_formatted])
+    war_ids = io.war_selection_table(basic_faction_info, war_list_formatted)
+    if len(war_ids) > 1:
+        display_mode = io.display_mode_prompt()
+        prefetcher.stop()
+        if display_mode == 3:
+            print("Batch mode saves files, choose display mode 0, 1 or 2. Exiting..")
+            sys.exit()
+        if args.profile:
+            print("Profiling only covers single war analysis, running the batch without it..")
+            prof.disable()
+        prefetcher.finish()
+        warm_up_thread.join()
+        import wa_batch as batch
+
+        batch.run_batch(api_key, basic_faction_info, war_ids, display_mode)
+        return
+
+    war_id = war_ids[0]
     # war_id =   # DEBUG
-    war_data = req.requestData(api_key, 2, war_id)["rankedwarreport"]
-    war_time_info = war_data["war"]
+    prefetcher.select(war_id)
+    with prof.stage("request war report"):
+        war_data = prefetcher.war_report(war_id)["rankedwarreport"]
 
     attack_df = None
     revive_df = None
@@ -26,32 +119,32 @@ def main():
     display_mode = io.display_mode_prompt()
     # display_mode = 0  # DEBUG
     if source == 0:
-        attack_data = req.requestData(api_key, 3, war_time_info=war_time_info)
-        attack_df = dh.load_dict_flatten_into_df(attack_data, "attacks")
-        attack_df = dh.prepare_attack_dataframe(attack_df, war_data)
-        io.export_df_to_csv(attack_df, war_id, "attacks")
-
-        revive_data = req.requestData(api_key, 5, war_time_info=war_time_info)
-        revive_df = dh.load_dict_flatten_into_df(revive_data, "revives")
-        revive_df = dh.prepare_revive_dataframe(revive_df)
-        io.export_df_to_csv(revive_df, war_id, "revives")
+        prefetcher.finish()  # The download reads what the prefetch archived
+    else:
+        prefetcher.stop()
+    warm_up_thread.join()
+    import wa_pipeline as pipe
+
+    aggregates = None
+    if source == 0:
+        # Prepared and totalled while the pages download
+        attack_df, revive_df, aggregates = pipe.download_and_prepare_war(
+            api_key, war_id, war_data, basic_faction_info
+        )
     elif source == 1:
-        attack_df = io.import_csv_to_df("war-" + str(war_id) + "-attacks.csv")
-        revive_df = io.import_csv_to_df("war-" + str(war_id) + "-revives.csv")
-
-    fig0 = dh.create_war_attacks_graph(attack_df, war_data)
-    fig1 = dh.create_assists_graph(attack_df, war_data)
-    fig2 = dh.create_net_score_graph(attack_df, basic_faction_info)
-    fig3 = dh.attacks_and_losses_player_graph(attack_df, basic_faction_info)
-    fig4 = dh.create_faction_revives_graph(revive_df, basic_faction_info)
-    fig5 = dh.create_player_revives_over_time_graph(revive_df, basic_faction_info)
-    fig6 = dh.create_player_revives_graph(revive_df, basic_faction_info)
-    fig7 = dh.create_respect_gainloss_graph(attack_df, war_data)
-    figs = [fig7, fig0, fig1, fig2, fig3, fig4, fig5, fig6]
-    summary_table = dh.create_faction_summary_table(
-        attack_df, revive_df, war_data, basic_faction_info
+        attack_df, revive_df = pipe.import_war(war_id, war_data)
+
+    pipe.write_war_report(
+        attack_df,
+        revive_df,
+        war_data,
+        basic_faction_info,
+        war_id,
+        display_mode,
+        aggregates=aggregates,
     )
-    io.display_figs(figs, display_mode, war_data, war_id, summary_table)
+    if args.profile:
+        prof.save("war-" + str(war_id) + "-profile-" + str(int(time())) + ".json")
 
 
 if __name__ == "__main__":